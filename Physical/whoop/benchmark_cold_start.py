@@ -0,0 +1,130 @@
+"""Measure the cold-start cost of the run_whoop_sleep cloud function.
+
+Reports:
+
+- the `python -X importtime` breakdown of `import whoop_sleep`, with the slowest
+  top-level imports, and
+- the latency of the first and a second (warm) call to `run_whoop_sleep` in the same
+  process. This part needs real WHOOP and Airtable credentials in the environment
+  and is skipped without them.
+
+Usage:
+    python benchmark_cold_start.py [--runs 5] [--invoke]
+
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+_INVOKE_SCRIPT = """
+import time
+started = time.perf_counter()
+import whoop_sleep
+imported = time.perf_counter()
+whoop_sleep.run_whoop_sleep(None, None)
+first = time.perf_counter()
+whoop_sleep.run_whoop_sleep(None, None)
+warm = time.perf_counter()
+print(f"RESULT {imported - started} {first - imported} {warm - first}")
+"""
+
+
+def measure_import(module: str = "whoop_sleep") -> tuple[int, list[tuple[int, str]]]:
+    """Import a module in a fresh interpreter with `-X importtime`.
+
+    Args:
+        module (str): Module to import. Defaults to "whoop_sleep".
+
+    Returns:
+        tuple[int, list[tuple[int, str]]]: Cumulative import time of `module` in
+            microseconds, and the cumulative time of every top-level import it
+            triggered.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+
+    total = 0
+    top_level = []
+    for line in result.stderr.splitlines():
+        if not (match := _IMPORTTIME_LINE.match(line)):
+            continue
+        cumulative, indent, name = int(match[2]), match[3], match[4]
+        if name == module:
+            total = cumulative
+        elif len(indent) <= 2:
+            top_level.append((cumulative, name))
+
+    return total, sorted(top_level, reverse=True)
+
+
+def measure_invocation() -> tuple[float, float, float]:
+    """Time the import, first call and warm call of `run_whoop_sleep`.
+
+    Returns:
+        tuple[float, float, float]: Seconds spent importing, in the first call and
+            in the second call.
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", _INVOKE_SCRIPT],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    line = next(
+        line for line in result.stdout.splitlines() if line.startswith("RESULT")
+    )
+    imported, first, warm = (float(value) for value in line.split()[1:])
+
+    return imported, first, warm
+
+
+def main() -> None:
+    """Run the benchmark from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--invoke",
+        action="store_true",
+        help="also call run_whoop_sleep twice (hits the WHOOP and Airtable APIs)",
+    )
+    args = parser.parse_args()
+
+    totals = []
+    for _ in range(args.runs):
+        total, top_level = measure_import()
+        totals.append(total)
+
+    print(
+        f"import whoop_sleep: median {statistics.median(totals) / 1000:.1f} ms "
+        f"over {args.runs} runs"
+    )
+    for cumulative, name in top_level[:10]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    if not args.invoke:
+        return
+    if not (os.getenv("USERNAME") and os.getenv("AIRTABLE_API_KEY")):
+        print("Skipping invocation benchmark: WHOOP/Airtable credentials not set")
+        return
+
+    imported, first, warm = measure_invocation()
+    print(f"import {imported:.3f}s, first invocation {first:.3f}s, warm {warm:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,16 @@
 from __future__ import annotations
 
 import os
+import csv
 import json
 from datetime import datetime, timedelta, time
 from typing import Any
 from dotenv import load_dotenv  # Add this import
 from authlib.common.urls import extract_params
 from authlib.integrations.requests_client import OAuth2Session
-import pandas as pd
+
+from whoop_profiling import span
+from whoop_sleep import extract_sleep_data
 
 load_dotenv()
 
@@ -24,16 +27,6 @@ def _auth_password_json(_client, _method, uri, headers, body):
     headers["Content-Type"] = "application/json"
     return uri, headers, body
 
-# Define the adjust_timezone function
-def adjust_timezone(dt_str, offset_str):
-    dt = datetime.fromisoformat(dt_str.replace("Z", "+00:00"))
-    hours, minutes = map(int, offset_str.split(":"))
-    if "+" in offset_str:
-        adjusted_dt = dt - timedelta(hours=hours, minutes=minutes)
-    else:
-        adjusted_dt = dt + timedelta(hours=hours, minutes=minutes)
-    return adjusted_dt.isoformat()
-
 # WhoopClient class for interacting with the WHOOP API
 class WhoopClient:
     TOKEN_ENDPOINT_AUTH_METHOD = "password_json"
@@ -118,11 +111,12 @@ class WhoopClient:
 
     def _make_request(self, method: str, url_slug: str, **kwargs: Any) -> dict[str, Any]:
         print(f"Making request to: {REQUEST_URL}/{url_slug} with params: {kwargs.get('params')}")
-        response = self.session.request(
-            method=method,
-            url=f"{REQUEST_URL}/{url_slug}",
-            **kwargs,
-        )
+        with span("network"):
+            response = self.session.request(
+                method=method,
+                url=f"{REQUEST_URL}/{url_slug}",
+                **kwargs,
+            )
         
         # Print the full response content for debugging
         print(f"Response status code: {response.status_code}")
@@ -130,7 +124,8 @@ class WhoopClient:
         
         response.raise_for_status()
 
-        return response.json()
+        with span("json_decode"):
+            return response.json()
 
     def _format_dates(self, start_date: str | None, end_date: str | None) -> tuple[str, str]:
         end = datetime.combine(
@@ -167,28 +162,15 @@ def fetch_and_save_sleep_data():
 
     sleep_data = client.get_sleep_collection(last_year_iso, today_iso)
 
-    def convert_millis_to_duration(millis):
-        return millis // 1000
-
-    extracted_sleep_data = [
-        {
-            "ID": record["id"],
-            "timezone_offset": record["timezone_offset"],  # Add timezone offset
-            "timezone_adjusted_start": adjust_timezone(record["start"], record["timezone_offset"]),  # Already present
-            "timezone_adjusted_end": adjust_timezone(record["end"], record["timezone_offset"]),  # Already present
-            "total_in_bed_time": convert_millis_to_duration(record["score"]["stage_summary"]["total_in_bed_time_milli"]),
-            "total_slow_wave_sleep_time": convert_millis_to_duration(record["score"]["stage_summary"]["total_slow_wave_sleep_time_milli"]),
-            "total_rem_sleep_time": convert_millis_to_duration(record["score"]["stage_summary"]["total_rem_sleep_time_milli"]),
-            "sleep_performance_percentage": record["score"]["sleep_performance_percentage"],
-            "need_from_sleep_debt": convert_millis_to_duration(record["score"]["sleep_needed"]["need_from_sleep_debt_milli"])
-        }
-        for record in sleep_data
-    ]
-
-    # Convert data to DataFrame and save as CSV
-    df = pd.DataFrame(extracted_sleep_data)
+    with span("transform"):
+        extracted_sleep_data = extract_sleep_data(sleep_data)
+
+    # Save as CSV
     output_file = "whoop_sleep_data.csv"
-    df.to_csv(output_file, index=False)
+    with span("sink:csv"), open(output_file, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(extracted_sleep_data[0]) if extracted_sleep_data else [])
+        writer.writeheader()
+        writer.writerows(extracted_sleep_data)
     print(f"Data successfully saved to {output_file}")
 
 # Run the function
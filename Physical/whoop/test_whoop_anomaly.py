@@ -0,0 +1,92 @@
+"""Tests of the streaming per-user anomaly detector."""
+
+from __future__ import annotations
+
+import random
+import statistics
+
+import pytest
+
+from whoop_anomaly import AnomalyDetector, MetricState
+
+
+def _recovery(record_id: int, resting_heart_rate: float) -> dict:
+    return {
+        "cycle_id": record_id,
+        "user_id": 1,
+        "created_at": f"2024-01-01T00:00:{record_id:02d}Z",
+        "score_state": "SCORED",
+        "score": {"resting_heart_rate": resting_heart_rate},
+    }
+
+
+def test_update_matches_batch_statistics():
+    rng = random.Random(0)
+    values = [rng.gauss(55, 4) for _ in range(50)]
+    alpha = 0.2
+    state = MetricState()
+
+    ewma = values[0]
+    ewm_var = 0.0
+    for value in values:
+        state.update(value, alpha, window_size=10)
+    for value in values[1:]:
+        diff = value - ewma
+        ewma += alpha * diff
+        ewm_var = (1 - alpha) * (ewm_var + alpha * diff * diff)
+
+    assert state.count == 50
+    assert state.mean == pytest.approx(statistics.mean(values))
+    assert state.std == pytest.approx(statistics.stdev(values))
+    assert state.ewma == pytest.approx(ewma)
+    assert state.ewm_var == pytest.approx(ewm_var)
+    assert sorted(state.window) == sorted(values[-10:])
+    assert state.position == 0
+
+
+def test_score_flags_jump_from_flat_baseline():
+    detector = AnomalyDetector()
+    state = MetricState()
+    for _ in range(30):
+        state.update(33.5, detector.alpha, detector.window_size)
+
+    anomaly = detector._score(state, "1", "skin_temp_celsius", "9", 36.0, "")
+
+    assert anomaly is not None
+    assert anomaly.mad == pytest.approx(0.335)
+    assert anomaly.robust_z == pytest.approx(5.03, abs=0.01)
+    assert detector._score(state, "1", "skin_temp_celsius", "9", 33.6, "") is None
+
+
+def test_score_needs_min_samples():
+    detector = AnomalyDetector(min_samples=14)
+    state = MetricState()
+    for value in [50, 51, 52] * 4:
+        state.update(value, detector.alpha, detector.window_size)
+
+    assert detector._score(state, "1", "resting_heart_rate", "9", 90.0, "") is None
+
+
+def test_observe_skips_records_already_seen():
+    detector = AnomalyDetector(min_samples=3)
+    records = [_recovery(i, 50 + i % 3) for i in range(10)]
+    detector.observe_all("recovery", records)
+    spike = _recovery(10, 80)
+
+    assert [a.record_id for a in detector.observe("recovery", spike)] == ["10"]
+    assert detector.observe("recovery", spike) == []
+
+
+def test_sink_reloads_state_saved_by_another_detector(tmp_path):
+    path = str(tmp_path / "anomaly.json")
+    server = AnomalyDetector(path).as_sink([])
+
+    scheduled = AnomalyDetector(path)
+    scheduled.observe_all("recovery", [_recovery(i, 50) for i in range(5)])
+    scheduled.save()
+
+    server("recovery", [_recovery(5, 50), _recovery(4, 50)], [])
+
+    state = AnomalyDetector(path)._states["1"]["resting_heart_rate"]
+    assert state.count == 6
+    assert state.recent_ids == ["0", "1", "2", "3", "4", "5"]
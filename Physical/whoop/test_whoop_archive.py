@@ -0,0 +1,67 @@
+"""Tests of the raw page archive and its keyed lookups."""
+
+from __future__ import annotations
+
+import pytest
+
+import whoop_archive
+from whoop_archive import PageArchive, record_key
+
+
+UUID = "ecfc6a15-4661-442f-a9a4-f160dd7afae8"
+
+
+def _sleep(record_id, updated_at: str, performance: int) -> dict:
+    return {
+        "id": record_id,
+        "updated_at": updated_at,
+        "score": {"sleep_performance_percentage": performance},
+    }
+
+
+@pytest.fixture(name="archive")
+def fixture_archive(tmp_path):
+    archive = PageArchive(str(tmp_path))
+    archive.append(
+        "v1/activity/sleep",
+        {},
+        {
+            "records": [
+                _sleep(123, "2024-01-02T00:00:00Z", 80),
+                _sleep(UUID, "2024-01-02T00:00:00Z", 70),
+            ]
+        },
+    )
+    archive.append("v1/activity/sleep/123", None, _sleep(123, "2024-01-03Z", 90))
+    archive.append("v1/cycle/123", None, {"id": 123, "updated_at": "2024-01-04Z"})
+    return archive
+
+
+def test_record_key_treats_digit_strings_as_integers():
+    assert record_key({"id": "123"}) == record_key({"id": 123}) == 123
+    assert record_key({"id": UUID}) == record_key({"id": UUID})
+    assert record_key({"id": "１２３"}) != 123
+    assert record_key({"id": str(2**64)}) != 0
+
+
+@pytest.mark.parametrize("sorted_tail", [10_000, 0])
+def test_find_returns_newest_version(archive, monkeypatch, sorted_tail):
+    monkeypatch.setattr(whoop_archive, "SORTED_TAIL_RECORDS", sorted_tail)
+
+    assert archive.find("sleep", "123")["score"] == {"sleep_performance_percentage": 90}
+    assert archive.find("sleep", 123) == archive.find("sleep", "123")
+    assert archive.find("sleep", UUID)["id"] == UUID
+    assert archive.find("cycle", "123")["updated_at"] == "2024-01-04Z"
+    assert archive.find("recovery", "123") is None
+    assert archive.find("sleep", "124") is None
+
+
+def test_find_scans_records_appended_after_the_sorted_index(archive, monkeypatch):
+    monkeypatch.setattr(whoop_archive, "SORTED_TAIL_RECORDS", 0)
+    archive.find("sleep", "123")
+
+    monkeypatch.setattr(whoop_archive, "SORTED_TAIL_RECORDS", 10_000)
+    archive.append("v1/activity/sleep/123", None, _sleep(123, "2024-01-05Z", 95))
+
+    assert archive._sorted_count() == 4
+    assert archive.find("sleep", "123")["score"] == {"sleep_performance_percentage": 95}
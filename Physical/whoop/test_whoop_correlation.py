@@ -0,0 +1,121 @@
+"""Tests of the vectorized correlation and regression helpers."""
+
+from __future__ import annotations
+
+from datetime import date
+
+import numpy as np
+import pytest
+
+from whoop_correlation import align_daily, lagged_correlation, rolling_regression
+
+
+def _cycle(cycle_id: int, day: int, strain: float) -> dict:
+    return {
+        "id": cycle_id,
+        "start": f"2024-01-{day:02d}T12:00:00.000Z",
+        "timezone_offset": "+00:00",
+        "score": {"strain": strain},
+    }
+
+
+CYCLES = [_cycle(1, 5, 10.0), _cycle(2, 7, 12.0), _cycle(3, 9, 14.0)]
+
+
+def _with_gaps(shape: tuple[int, ...], seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    values = rng.normal(size=shape)
+    values[rng.random(shape) < 0.2] = np.nan
+    return values
+
+
+def test_lagged_correlation_matches_corrcoef_on_masked_pairs():
+    values = _with_gaps((60, 3), seed=0)
+    result = lagged_correlation(values, max_lag=3)
+
+    for lag in range(4):
+        for i in range(3):
+            for j in range(3):
+                a = values[: len(values) - lag, i]
+                b = values[lag:, j]
+                both = ~(np.isnan(a) | np.isnan(b))
+                expected = np.corrcoef(a[both], b[both])[0, 1]
+                assert result[lag, i, j] == pytest.approx(expected)
+
+
+def test_lagged_correlation_does_not_cross_users():
+    stacked = _with_gaps((2, 30, 2), seed=1)
+    result = lagged_correlation(stacked, max_lag=1)
+
+    a = np.concatenate([stacked[0, :-1, 0], stacked[1, :-1, 0]])
+    b = np.concatenate([stacked[0, 1:, 1], stacked[1, 1:, 1]])
+    both = ~(np.isnan(a) | np.isnan(b))
+    assert result[1, 0, 1] == pytest.approx(np.corrcoef(a[both], b[both])[0, 1])
+
+
+def test_rolling_regression_matches_polyfit():
+    x = _with_gaps((50,), seed=2)
+    y = 2 * x + np.random.default_rng(3).normal(scale=0.5, size=50)
+    window = 10
+
+    slope, intercept, r_squared = rolling_regression(x, y, window=window)
+
+    for end in range(window - 1, 50):
+        xs = x[end - window + 1 : end + 1]
+        ys = y[end - window + 1 : end + 1]
+        both = ~(np.isnan(xs) | np.isnan(ys))
+        if both.sum() < 7:
+            assert np.isnan(slope[end])
+            continue
+        expected_slope, expected_intercept = np.polyfit(xs[both], ys[both], 1)
+        assert slope[end] == pytest.approx(expected_slope)
+        assert intercept[end] == pytest.approx(expected_intercept)
+        r = np.corrcoef(xs[both], ys[both])[0, 1]
+        assert r_squared[end] == pytest.approx(r * r)
+
+
+@pytest.mark.parametrize(
+    ("start", "end", "first", "last"),
+    [
+        (date(2024, 1, 6), None, "2024-01-06", "2024-01-09"),
+        (None, date(2024, 1, 8), "2024-01-05", "2024-01-08"),
+        (date(2024, 1, 12), None, "2024-01-12", "2024-01-12"),
+        (None, date(2024, 1, 2), "2024-01-02", "2024-01-02"),
+    ],
+)
+def test_align_daily_one_sided_bounds(start, end, first, last):
+    matrix = align_daily(cycles=CYCLES, columns=["strain"], start=start, end=end)
+
+    assert str(matrix.days[0]) == first
+    assert str(matrix.days[-1]) == last
+    expected = {"2024-01-05": 10.0, "2024-01-07": 12.0, "2024-01-09": 14.0}
+    for day, value in zip(matrix.days, matrix.column("strain")):
+        if str(day) in expected:
+            assert value == expected[str(day)]
+        else:
+            assert np.isnan(value)
+
+
+@pytest.mark.parametrize(
+    ("start", "end", "n_days"),
+    [(date(2024, 1, 6), None, 1), (None, date(2024, 1, 6), 1), (None, None, 0)],
+)
+def test_align_daily_without_records(start, end, n_days):
+    matrix = align_daily(columns=["strain"], start=start, end=end)
+
+    assert matrix.values.shape == (n_days, 1)
+    assert np.isnan(matrix.values).all()
+
+
+def test_recovery_without_its_cycle_uses_created_at():
+    recovery = {
+        "cycle_id": 99,
+        "created_at": "2024-01-06T11:00:00.000Z",
+        "score": {"recovery_score": 70},
+    }
+    matrix = align_daily(
+        cycles=CYCLES, recoveries=[recovery], columns=["recovery_score"]
+    )
+
+    assert str(matrix.days[0]) == "2024-01-06"
+    assert matrix.values[0, 0] == 70
@@ -0,0 +1,226 @@
+"""Tests of the incrementally maintained rollup index."""
+
+from __future__ import annotations
+
+import pytest
+
+from whoop_rollups import RollupIndex, _combine, update_rollups
+
+
+def _cycle(cycle_id: int, start: str, strain: float, offset: str = "+00:00") -> dict:
+    return {
+        "id": cycle_id,
+        "start": start,
+        "timezone_offset": offset,
+        "score_state": "SCORED",
+        "score": {"strain": strain, "kilojoule": 1000.0},
+    }
+
+
+def _recovery(cycle_id: int, score: float) -> dict:
+    return {
+        "cycle_id": cycle_id,
+        "created_at": "2024-01-01T00:00:00Z",
+        "score_state": "SCORED",
+        "score": {"recovery_score": score},
+    }
+
+
+def _sleep(sleep_id: int, end: str, performance: float) -> dict:
+    return {
+        "id": sleep_id,
+        "end": end,
+        "timezone_offset": "-05:00",
+        "score_state": "SCORED",
+        "score": {
+            "sleep_performance_percentage": performance,
+            "stage_summary": {
+                "total_in_bed_time_milli": 8 * 3_600_000,
+                "total_rem_sleep_time_milli": 2 * 3_600_000,
+                "total_slow_wave_sleep_time_milli": 3_600_000,
+            },
+        },
+    }
+
+
+def test_sleeps_are_keyed_by_local_end_date():
+    index = RollupIndex()
+    index.add_sleeps([_sleep(1, "2024-01-10T03:00:00.000Z", 80)])
+
+    assert list(index.daily) == ["2024-01-09"]
+    assert index.daily["2024-01-09"]["total_in_bed_time"]["sum"] == 8 * 3600
+
+
+def test_reingested_record_moves_out_of_its_old_periods():
+    index = RollupIndex()
+    index.add_cycles([_cycle(1, "2024-01-31T12:00:00.000Z", 10.0)])
+    assert "2024-01-31" in index.daily
+    assert "2024-W05" in index.weekly
+    assert "2024-01" in index.monthly
+
+    touched = index.add_cycles([_cycle(1, "2024-02-05T12:00:00.000Z", 12.0)])
+
+    assert touched == {"2024-01-31", "2024-02-05"}
+    assert list(index.daily) == ["2024-02-05"]
+    assert list(index.weekly) == ["2024-W06"]
+    assert list(index.monthly) == ["2024-02"]
+    assert index.monthly["2024-02"]["strain"]["mean"] == 12.0
+
+
+def test_unchanged_record_touches_nothing():
+    index = RollupIndex()
+    cycle = _cycle(1, "2024-01-31T12:00:00.000Z", 10.0)
+    index.add_cycles([cycle])
+
+    assert index.add_cycles([cycle]) == set()
+
+
+def test_week_and_month_boundaries():
+    index = RollupIndex()
+    index.add_cycles(
+        [
+            _cycle(1, "2023-12-31T12:00:00.000Z", 4.0),  # Sunday of 2023-W52
+            _cycle(2, "2024-01-01T12:00:00.000Z", 6.0),  # Monday of 2024-W01
+            _cycle(3, "2024-01-07T12:00:00.000Z", 8.0),  # Sunday of 2024-W01
+            _cycle(4, "2024-02-01T12:00:00.000Z", 10.0),
+        ]
+    )
+
+    assert index.weekly["2023-W52"]["strain"]["count"] == 1
+    assert index.weekly["2024-W01"]["strain"] == {
+        "sum": 14.0,
+        "count": 2,
+        "min": 6.0,
+        "max": 8.0,
+        "mean": 7.0,
+    }
+    assert index.monthly["2023-12"]["strain"]["sum"] == 4.0
+    assert index.monthly["2024-01"]["strain"]["sum"] == 14.0
+    assert index.monthly["2024-02"]["strain"]["sum"] == 10.0
+
+
+def test_local_date_crosses_midnight_with_offset():
+    index = RollupIndex()
+    index.add_cycles([_cycle(1, "2024-01-31T20:00:00.000Z", 10.0, "+05:30")])
+
+    assert list(index.daily) == ["2024-02-01"]
+    assert list(index.monthly) == ["2024-02"]
+
+
+def test_rolling_window_contents():
+    index = RollupIndex()
+    index.add_cycles(
+        [
+            _cycle(1, "2024-03-01T12:00:00.000Z", 10.0),
+            _cycle(2, "2024-03-05T12:00:00.000Z", 20.0),
+        ]
+    )
+
+    assert index.get_rolling(7, "2024-03-05")["strain"]["mean"] == 15.0
+    assert index.get_rolling(7, "2024-03-07")["strain"]["count"] == 2
+    assert index.get_rolling(7, "2024-03-08")["strain"]["count"] == 1
+    assert index.get_rolling(7, "2024-03-11")["strain"]["sum"] == 20.0
+    assert index.get_rolling(7, "2024-03-12") == {}
+    assert index.get_rolling(7, "2024-02-29") == {}
+    assert sorted(index.rolling["7"]) == [
+        f"2024-03-{day:02d}" for day in range(1, 12)
+    ]
+    assert index.get_rolling(30, "2024-03-30")["strain"]["count"] == 2
+    assert index.get_rolling(30, "2024-03-31")["strain"]["count"] == 1
+
+
+def test_recoveries_use_their_cycles_local_date():
+    index = RollupIndex()
+    index.add_cycles([_cycle(1, "2024-01-10T02:00:00.000Z", 10.0, "-05:00")])
+    index.add_recoveries([_recovery(1, 66.0), _recovery(2, 50.0)])
+
+    assert index.records["recovery:1"]["date"] == "2024-01-09"
+    assert index.records["recovery:2"]["date"] == "2024-01-01"
+
+
+def test_recoveries_use_cycles_passed_alongside():
+    index = RollupIndex()
+    cycle = _cycle(3, "2024-01-10T02:00:00.000Z", 10.0, "-05:00")
+    index.add_recoveries([_recovery(3, 66.0)], cycles=[cycle])
+
+    assert index.records["recovery:3"]["date"] == "2024-01-09"
+    assert index.daily["2024-01-09"]["recovery_score"]["mean"] == 66.0
+
+
+def test_combine_without_stats():
+    assert _combine([]) is None
+
+
+def test_remove_recomputes_affected_periods():
+    index = RollupIndex()
+    index.add_cycles(
+        [
+            _cycle(1, "2024-01-01T12:00:00.000Z", 10.0),
+            _cycle(2, "2024-01-02T12:00:00.000Z", 20.0),
+        ]
+    )
+
+    assert index.remove("cycle", ["2", 99]) == {"2024-01-02"}
+    assert list(index.daily) == ["2024-01-01"]
+    assert index.weekly["2024-W01"]["strain"]["sum"] == 10.0
+    assert index.get_rolling(7, "2024-01-02")["strain"]["count"] == 1
+
+    index.remove("cycle", [1])
+    assert index.daily == index.weekly == index.monthly == {}
+    assert index.rolling == {"7": {}, "30": {}}
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "rollups.json")
+    index = RollupIndex(path)
+    index.add_cycles([_cycle(1, "2024-01-01T12:00:00.000Z", 10.0)])
+    index.add_sleeps([_sleep(2, "2024-01-02T12:00:00.000Z", 90.0)])
+    index.save()
+
+    loaded = RollupIndex(path)
+    for name in ("records", "daily", "weekly", "monthly", "rolling"):
+        assert getattr(loaded, name) == getattr(index, name)
+
+    # The date index is rebuilt on load, so later updates still move records
+    loaded.add_cycles([_cycle(1, "2024-01-03T12:00:00.000Z", 10.0)])
+    assert "2024-01-01" not in loaded.daily
+
+
+def test_save_without_path_raises():
+    with pytest.raises(ValueError, match="No path"):
+        RollupIndex().save()
+
+
+def test_update_rollups_applies_deletions(tmp_path):
+    path = str(tmp_path / "rollups.json")
+    update_rollups(path, cycles=[_cycle(1, "2024-01-01T12:00:00.000Z", 10.0)])
+
+    touched = update_rollups(
+        path,
+        cycles=[_cycle(2, "2024-01-05T12:00:00.000Z", 5.0)],
+        deleted={"cycle": ["1"]},
+    )
+
+    assert touched == {"2024-01-01", "2024-01-05"}
+    assert list(RollupIndex(path).daily) == ["2024-01-05"]
+
+
+def test_unscored_and_partial_records_contribute_no_metrics():
+    pending = {**_sleep(1, "2024-01-10T12:00:00.000Z", 80), "score_state": "PENDING"}
+    partial = _sleep(2, "2024-01-11T12:00:00.000Z", 70)
+    del partial["score"]["stage_summary"]
+    index = RollupIndex()
+    index.add_sleeps([pending, partial])
+
+    assert index.records["sleep:1"]["metrics"] == {}
+    assert index.get_daily("2024-01-01", "2024-01-31") == {
+        "2024-01-11": {
+            "sleep_performance_percentage": {
+                "sum": 70.0,
+                "count": 1,
+                "min": 70.0,
+                "max": 70.0,
+                "mean": 70.0,
+            }
+        }
+    }
@@ -0,0 +1,125 @@
+"""Tests of WHOOP timestamp normalization against real IANA zones."""
+
+from __future__ import annotations
+
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from whoop_time import (
+    localize_records,
+    parse_offset,
+    parse_utc,
+    to_local,
+    to_local_column,
+)
+
+
+# Half-hour, 45-minute and negative fractional offsets, with and without DST
+ZONES = [
+    "Asia/Kolkata",
+    "Australia/Eucla",
+    "Pacific/Marquesas",
+    "Pacific/Chatham",
+    "America/St_Johns",
+    "America/New_York",
+    "UTC",
+]
+
+
+def _offset_string(offset: timedelta) -> str:
+    minutes = int(offset.total_seconds()) // 60
+    sign = "-" if minutes < 0 else "+"
+    hours, minutes = divmod(abs(minutes), 60)
+    return f"{sign}{hours:02d}:{minutes:02d}"
+
+
+def _samples(n: int = 2000) -> list[datetime]:
+    rng = random.Random(0)
+    base = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    return [
+        base + timedelta(milliseconds=rng.randrange(5 * 365 * 86400 * 1000))
+        for _ in range(n)
+    ]
+
+
+@pytest.mark.parametrize("zone_name", ZONES)
+def test_to_local_matches_zoneinfo_wall_clock(zone_name):
+    zone = ZoneInfo(zone_name)
+
+    for instant in _samples():
+        stamp = instant.isoformat(timespec="milliseconds").replace("+00:00", "Z")
+        expected = instant.astimezone(zone)
+        local = to_local(stamp, _offset_string(expected.utcoffset()))
+
+        assert local.replace(tzinfo=None) == expected.replace(tzinfo=None)
+        assert local.utcoffset() == expected.utcoffset()
+
+
+@pytest.mark.parametrize(
+    ("offset", "expected"),
+    [
+        ("+05:30", "2022-04-23T07:55:44.774000+05:30"),
+        ("+08:45", "2022-04-23T11:10:44.774000+08:45"),
+        ("-09:30", "2022-04-22T16:55:44.774000-09:30"),
+        ("-05:00", "2022-04-22T21:25:44.774000-05:00"),
+        ("+0530", "2022-04-23T07:55:44.774000+05:30"),
+        ("Z", "2022-04-23T02:25:44.774000+00:00"),
+    ],
+)
+def test_to_local_examples(offset, expected):
+    assert to_local("2022-04-23T02:25:44.774Z", offset).isoformat() == expected
+
+
+def test_to_local_column_matches_to_local():
+    rng = random.Random(1)
+    offsets = ["+05:30", "+08:45", "-09:30", "+12:45", "-03:30", "-04:00"]
+    stamps = [
+        instant.isoformat(timespec="milliseconds").replace("+00:00", "Z")
+        for instant in _samples(500)
+    ]
+    zones = [rng.choice(offsets) for _ in stamps]
+
+    assert to_local_column(stamps, zones) == [
+        to_local(stamp, offset) for stamp, offset in zip(stamps, zones)
+    ]
+
+
+def test_localize_records():
+    records = [
+        {"end": "2022-04-23T02:25:44.774Z", "timezone_offset": "+05:30"},
+        {"end": "2022-04-23T02:25:44.774Z", "timezone_offset": "-09:30"},
+    ]
+
+    assert [local.isoformat() for local in localize_records(records, "end")] == [
+        "2022-04-23T07:55:44.774000+05:30",
+        "2022-04-22T16:55:44.774000-09:30",
+    ]
+
+
+@pytest.mark.parametrize("offset", ["", "05:30", "+5:30", "EST", "+05:30:00"])
+def test_parse_offset_rejects_invalid(offset):
+    with pytest.raises(ValueError, match="Invalid timezone offset"):
+        parse_offset(offset)
+
+
+def test_parse_utc_assumes_utc_without_offset():
+    assert parse_utc("2022-04-23T02:25:44") == datetime(
+        2022, 4, 23, 2, 25, 44, tzinfo=timezone.utc
+    )
+
+
+def test_to_local_column_assumes_utc_without_offset(monkeypatch):
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    try:
+        assert to_local_column(["2022-04-23T02:25:44"], ["+05:30"]) == [
+            to_local("2022-04-23T02:25:44", "+05:30")
+        ]
+        assert to_local_column(["2022-04-23T02:25:44"], ["+05:30"])[0].hour == 7
+    finally:
+        monkeypatch.undo()
+        time.tzset()
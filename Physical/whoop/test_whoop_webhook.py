@@ -0,0 +1,195 @@
+"""End-to-end tests of the webhook sync against a local event emitter."""
+
+from __future__ import annotations
+
+import json
+import threading
+import urllib.error
+from datetime import date, timedelta
+from typing import Any
+
+import pytest
+from werkzeug.serving import make_server
+
+from whoop_webhook import (
+    EventQueue,
+    IncrementalSyncer,
+    LocalEventEmitter,
+    create_app,
+    local_store_sink,
+)
+
+
+SECRET = "test-secret"  # noqa: S105
+
+SLEEP = {
+    "id": 93845,
+    "start": "2024-01-05T23:00:00.000Z",
+    "end": "2024-01-06T07:00:00.000Z",
+    "updated_at": "2024-01-06T07:30:00.000Z",
+}
+RECOVERY = {"cycle_id": 512, "sleep_id": 93845, "updated_at": "2024-01-06T08:00:00Z"}
+CYCLE = {"id": 512, "start": "2024-01-05T08:00:00.000Z", "updated_at": "2024-01-06Z"}
+
+
+class StubClient:
+    """WhoopClient stand-in serving fixed records and counting fetches."""
+
+    def __init__(self, sleeps: dict[str, dict[str, Any]]):
+        self.sleeps = sleeps
+        self.fetches: list[str] = []
+        self.collections: dict[str, list[dict[str, Any]]] = {}
+
+    def get_sleep_by_id(self, sleep_id: str) -> dict[str, Any]:
+        self.fetches.append(sleep_id)
+        if sleep_id not in self.sleeps:
+            raise RuntimeError("404 Client Error: Not Found")
+        return self.sleeps[sleep_id]
+
+    def get_recovery_collection(self, *_: str) -> list[dict[str, Any]]:
+        return self.collections.get("recovery", [RECOVERY])
+
+    def get_cycle_by_id(self, _cycle_id: str) -> dict[str, Any]:
+        return CYCLE
+
+    def get_sleep_collection(self, *_: str) -> list[dict[str, Any]]:
+        return self.collections.get("sleep", [])
+
+    def get_cycle_collection(self, *_: str) -> list[dict[str, Any]]:
+        return self.collections.get("cycle", [])
+
+    def get_workout_collection(self, *_: str) -> list[dict[str, Any]]:
+        return self.collections.get("workout", [])
+
+
+@pytest.fixture(name="queue")
+def fixture_queue():
+    return EventQueue(coalesce_seconds=0.05)
+
+
+@pytest.fixture(name="emitter")
+def fixture_emitter(queue):
+    server = make_server("127.0.0.1", 0, create_app(queue, SECRET))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield LocalEventEmitter(
+        f"http://127.0.0.1:{server.server_port}/whoop/webhook", secret=SECRET
+    )
+
+    server.shutdown()
+    thread.join()
+
+
+@pytest.fixture(name="pushed")
+def fixture_pushed():
+    return []
+
+
+@pytest.fixture(name="client")
+def fixture_client():
+    return StubClient({"93845": SLEEP})
+
+
+@pytest.fixture(name="syncer")
+def fixture_syncer(tmp_path, client, pushed):
+    return IncrementalSyncer(
+        lambda: client,
+        [lambda *batch: pushed.append(batch)],
+        state_path=str(tmp_path / "state.json"),
+    )
+
+
+def test_events_are_coalesced_fetched_and_pushed(
+    emitter, queue, client, syncer, pushed
+):
+    assert emitter.emit("sleep.updated", 93845) == 204
+    assert emitter.emit("sleep.updated", 93845) == 204
+    assert emitter.emit("workout.deleted", 77) == 204
+
+    assert syncer.process(queue.get_batch(timeout=2)) == []
+    assert client.fetches == ["93845"]
+    assert pushed == [("sleep", [SLEEP], []), ("workout", [], ["77"])]
+
+
+def test_recovery_event_pushes_recovery_and_cycle(emitter, queue, syncer, pushed):
+    assert emitter.emit("recovery.updated", 93845) == 204
+
+    syncer.process(queue.get_batch(timeout=2))
+
+    assert pushed == [("cycle", [CYCLE], []), ("recovery", [RECOVERY], [])]
+
+
+def test_recovery_deletion_is_pushed_under_its_cycle_id(
+    emitter, queue, client, tmp_path, pushed
+):
+    syncer = IncrementalSyncer(
+        lambda: client,
+        [lambda *batch: pushed.append(batch), local_store_sink(str(tmp_path))],
+        state_path=str(tmp_path / "state.json"),
+    )
+    emitter.emit("recovery.updated", 93845)
+    syncer.process(queue.get_batch(timeout=2))
+
+    emitter.emit("recovery.deleted", 93845)
+    syncer.process(queue.get_batch(timeout=2))
+
+    assert pushed[-1] == ("recovery", [], ["512"])
+    with open(tmp_path / "recovery.json", encoding="utf-8") as file:
+        assert json.load(file) == []
+
+
+def _day(days_ago: int) -> str:
+    return f"{date.today() - timedelta(days=days_ago)}T08:00:00.000Z"
+
+
+def test_reconcile_pushes_missed_updates_and_deletions(client, syncer, pushed):
+    cycle = {"id": 600, "start": _day(2), "updated_at": "1"}
+    recovery = {"cycle_id": 600, "sleep_id": 700, "updated_at": "1"}
+    kept = {"id": 701, "start": _day(3), "updated_at": "1"}
+    gone = {"id": 700, "start": _day(2), "updated_at": "1"}
+    old = {"id": 699, "start": _day(9), "updated_at": "1"}
+    syncer._push(
+        {"sleep": [kept, gone, old], "cycle": [cycle], "recovery": [recovery]}, {}
+    )
+    pushed.clear()
+
+    changed = dict(kept, updated_at="2")
+    client.collections = {"sleep": [changed], "cycle": [], "recovery": []}
+
+    assert syncer.reconcile(days=7) == 4
+    assert pushed == [
+        ("cycle", [], ["600"]),
+        ("recovery", [], ["600"]),
+        ("sleep", [changed], ["700"]),
+    ]
+
+    pushed.clear()
+    assert syncer.reconcile(days=7) == 0
+    assert pushed == []
+
+
+def test_failed_fetch_keeps_rest_of_batch(emitter, queue, syncer, pushed):
+    emitter.emit("sleep.updated", 404)
+    emitter.emit("sleep.deleted", 93846)
+
+    assert syncer.process(queue.get_batch(timeout=2)) == [("sleep", "404")]
+    assert pushed == [("sleep", [], ["93846"])]
+
+
+def test_bad_signature_is_rejected(emitter, queue):
+    emitter.secret = "wrong"
+
+    with pytest.raises(urllib.error.HTTPError) as error:
+        emitter.emit("sleep.updated", 93845)
+
+    assert error.value.code == 401
+    assert queue.get_batch(timeout=0.1) == {}
+
+
+def test_invalid_record_id_is_rejected(emitter, queue):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        emitter.emit("sleep.deleted", "x' OR TRUE() OR '")
+
+    assert error.value.code == 400
+    assert queue.get_batch(timeout=0.1) == {}
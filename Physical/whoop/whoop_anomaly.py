@@ -0,0 +1,348 @@
+"""Streaming anomaly detection on WHOOP recovery and sleep metrics.
+
+Each user's baseline for resting heart rate, HRV, skin temperature and sleep
+performance is kept as constant-size state that is updated one record at a time:
+
+- Welford's running mean and variance over the whole history,
+- an exponentially weighted mean and variance that tracks recent drift, and
+- a fixed-size ring buffer of recent values for a robust median/MAD baseline.
+
+A new value is scored against the baseline *before* it is folded in. It is reported
+as an anomaly when its robust z-score (0.6745 * (x - median) / MAD) exceeds
+`robust_threshold` and its EWMA z-score exceeds `ewma_threshold`. Both scales are
+floored at `min_scale_fraction` of the median, so a flat or quantized baseline (a MAD
+of 0) still flags a jump instead of disabling detection. The state is persisted as
+JSON between runs, so a sync never has to revisit the full history.
+
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import os
+import statistics
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable
+
+
+# metric -> (collection, path inside "score")
+METRICS: dict[str, tuple[str, tuple[str, ...]]] = {
+    "resting_heart_rate": ("recovery", ("resting_heart_rate",)),
+    "hrv_rmssd_milli": ("recovery", ("hrv_rmssd_milli",)),
+    "skin_temp_celsius": ("recovery", ("skin_temp_celsius",)),
+    "sleep_performance_percentage": ("sleep", ("sleep_performance_percentage",)),
+}
+
+
+@dataclass
+class MetricState:
+    """Constant-size baseline of one metric for one user."""
+
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    ewma: float = 0.0
+    ewm_var: float = 0.0
+    window: list[float] = field(default_factory=list)
+    position: int = 0
+    recent_ids: list[str] = field(default_factory=list)
+
+    @property
+    def std(self) -> float:
+        """float: Sample standard deviation over the whole history."""
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def update(self, value: float, alpha: float, window_size: int) -> None:
+        """Fold a new value into the baseline.
+
+        Args:
+            value (float): New observation.
+            alpha (float): EWMA smoothing factor.
+            window_size (int): Capacity of the ring buffer.
+        """
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+        if self.count == 1:
+            self.ewma = value
+        else:
+            diff = value - self.ewma
+            self.ewma += alpha * diff
+            self.ewm_var = (1 - alpha) * (self.ewm_var + alpha * diff * diff)
+
+        if len(self.window) < window_size:
+            self.window.append(value)
+        else:
+            self.window[self.position] = value
+        self.position = (self.position + 1) % window_size
+
+
+@dataclass
+class Anomaly:
+    """A metric value that deviates from the user's baseline."""
+
+    user_id: str
+    metric: str
+    record_id: str
+    value: float
+    median: float
+    mad: float
+    robust_z: float
+    ewma: float
+    ewma_z: float
+    mean: float
+    std: float
+    observed_at: str
+
+
+class AnomalyDetector:
+    """Incremental per-user anomaly detector.
+
+    Attributes:
+        state_path (str | None): JSON file the per-user state is persisted to.
+        window_size (int): Capacity of each ring buffer.
+        alpha (float): EWMA smoothing factor.
+        robust_threshold (float): Minimum absolute robust z-score of an anomaly.
+        ewma_threshold (float): Minimum absolute EWMA z-score of an anomaly.
+        min_samples (int): Observations needed before anything is flagged.
+        min_scale_fraction (float): Floor of the MAD as a fraction of the median.
+    """
+
+    def __init__(
+        self,
+        state_path: str | None = None,
+        window_size: int = 30,
+        alpha: float = 0.1,
+        robust_threshold: float = 3.5,
+        ewma_threshold: float = 2.5,
+        min_samples: int = 14,
+        min_scale_fraction: float = 0.01,
+    ):
+        """Initialize a detector, loading saved state from `state_path` if present.
+
+        Args:
+            state_path (str, optional): JSON file for the per-user state.
+            window_size (int): Capacity of each ring buffer. Defaults to 30.
+            alpha (float): EWMA smoothing factor. Defaults to 0.1.
+            robust_threshold (float): Minimum absolute robust z-score of an anomaly.
+                Defaults to 3.5.
+            ewma_threshold (float): Minimum absolute EWMA z-score of an anomaly.
+                Defaults to 2.5.
+            min_samples (int): Observations needed before anything is flagged.
+                Defaults to 14.
+            min_scale_fraction (float): Floor of the MAD as a fraction of the
+                median. Defaults to 0.01.
+        """
+        self.state_path = state_path
+        self.window_size = window_size
+        self.alpha = alpha
+        self.robust_threshold = robust_threshold
+        self.ewma_threshold = ewma_threshold
+        self.min_samples = min_samples
+        self.min_scale_fraction = min_scale_fraction
+        self._states: dict[str, dict[str, MetricState]] = {}
+        self.load()
+
+    def load(self) -> None:
+        """Replace the in-memory state with the state saved at `state_path`, if any."""
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+
+        with open(self.state_path, encoding="utf-8") as file:
+            self._states = {
+                user_id: {
+                    metric: MetricState(**state)
+                    for metric, state in metrics.items()
+                }
+                for user_id, metrics in json.load(file).items()
+            }
+
+    def observe(self, collection: str, record: dict[str, Any]) -> list[Anomaly]:
+        """Score one record against its user's baseline and then update it.
+
+        Records that were already observed (e.g. re-fetched by an overlapping sync
+        window) are ignored, as are unscored records.
+
+        Args:
+            collection (str): "sleep" or "recovery".
+            record (dict[str, Any]): Raw WHOOP record.
+
+        Returns:
+            list[Anomaly]: Anomalies found in the record.
+        """
+        score = record.get("score")
+        if not score or record.get("score_state", "SCORED") != "SCORED":
+            return []
+
+        user_id = str(record.get("user_id", ""))
+        record_id = str(record.get("id", record.get("cycle_id", "")))
+        observed_at = record.get("end") or record.get("created_at") or ""
+        anomalies = []
+
+        for metric, (metric_collection, path) in METRICS.items():
+            if metric_collection != collection:
+                continue
+
+            value: Any = score
+            for key in path:
+                value = value.get(key) if isinstance(value, dict) else None
+            if value is None:
+                continue
+
+            state = self._states.setdefault(user_id, {}).setdefault(
+                metric, MetricState()
+            )
+            if record_id in state.recent_ids:
+                continue
+
+            if anomaly := self._score(
+                state, user_id, metric, record_id, float(value), observed_at
+            ):
+                anomalies.append(anomaly)
+
+            state.update(float(value), self.alpha, self.window_size)
+            state.recent_ids = (state.recent_ids + [record_id])[-self.window_size :]
+
+        return anomalies
+
+    def observe_all(
+        self, collection: str, records: list[dict[str, Any]]
+    ) -> list[Anomaly]:
+        """Observe records in chronological order.
+
+        WHOOP collections are returned newest first, so records are sorted by their
+        timestamps before being observed.
+
+        Args:
+            collection (str): "sleep" or "recovery".
+            records (list[dict[str, Any]]): Raw WHOOP records.
+
+        Returns:
+            list[Anomaly]: Anomalies found in the records.
+        """
+        ordered = sorted(
+            records,
+            key=lambda record: record.get("end") or record.get("created_at", ""),
+        )
+        return [
+            anomaly
+            for record in ordered
+            for anomaly in self.observe(collection, record)
+        ]
+
+    def save(self) -> None:
+        """Persist the per-user state to `state_path`, if set."""
+        if not self.state_path:
+            return
+
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    user_id: {
+                        metric: asdict(state) for metric, state in metrics.items()
+                    }
+                    for user_id, metrics in self._states.items()
+                },
+                file,
+            )
+        os.replace(tmp_path, self.state_path)
+
+    def as_sink(
+        self, emit: list[Callable[[str, list[dict[str, Any]], list[str]], None]]
+    ) -> Callable[[str, list[dict[str, Any]], list[str]], None]:
+        """Wrap the detector as a sink for `whoop_webhook.IncrementalSyncer`.
+
+        The state is reloaded before every batch, since scheduled runs of
+        `run_whoop_sleep` save to the same file while the sink is alive.
+
+        Args:
+            emit (list[Callable]): Sinks that receive anomalies as an "anomaly"
+                collection.
+
+        Returns:
+            Callable: Sink that observes sleep and recovery records.
+        """
+
+        def anomaly_detector(
+            collection: str, records: list[dict[str, Any]], _deleted_ids: list[str]
+        ) -> None:
+            if collection not in ("sleep", "recovery") or not records:
+                return
+
+            self.load()
+            anomalies = self.observe_all(collection, records)
+            self.save()
+
+            if anomalies:
+                events = [asdict(anomaly) for anomaly in anomalies]
+                for sink in emit:
+                    sink("anomaly", events, [])
+
+        return anomaly_detector
+
+    def _score(
+        self,
+        state: MetricState,
+        user_id: str,
+        metric: str,
+        record_id: str,
+        value: float,
+        observed_at: str,
+    ) -> Anomaly | None:
+        if state.count < self.min_samples:
+            return None
+
+        median = statistics.median(state.window)
+        mad = max(
+            statistics.median(abs(x - median) for x in state.window),
+            self.min_scale_fraction * abs(median),
+        )
+        if not mad:
+            return None
+        # A flat recent history falls back to the robust estimate of the std
+        ewm_std = max(math.sqrt(state.ewm_var), mad / 0.6745)
+
+        robust_z = 0.6745 * (value - median) / mad
+        ewma_z = (value - state.ewma) / ewm_std
+        if abs(robust_z) < self.robust_threshold or abs(ewma_z) < self.ewma_threshold:
+            return None
+
+        return Anomaly(
+            user_id=user_id,
+            metric=metric,
+            record_id=record_id,
+            value=value,
+            median=median,
+            mad=mad,
+            robust_z=round(robust_z, 3),
+            ewma=state.ewma,
+            ewma_z=round(ewma_z, 3),
+            mean=state.mean,
+            std=state.std,
+            observed_at=observed_at,
+        )
+
+
+def print_anomalies(
+    collection: str, records: list[dict[str, Any]], _deleted_ids: list[str]
+) -> None:
+    """Sink that prints anomaly events.
+
+    Args:
+        collection (str): Only "anomaly" batches are printed.
+        records (list[dict[str, Any]]): Anomaly events.
+        _deleted_ids (list[str]): Unused.
+    """
+    if collection != "anomaly":
+        return
+
+    for event in records:
+        print(
+            f"Anomaly for user {event['user_id']}: {event['metric']}={event['value']} "
+            f"(median {event['median']:.1f}, robust z {event['robust_z']:+.1f}) "
+            f"in record {event['record_id']}"
+        )
@@ -0,0 +1,444 @@
+"""Append-only archive of raw WHOOP API pages for offline reprocessing.
+
+Every JSON page returned by `WhoopClient._make_request` can be appended to a
+compressed segment log. Changing a transform (a new field, a timezone fix) then no
+longer means re-downloading the history: `PageArchive.replay` feeds the archived
+records through any transform or sink at disk speed.
+
+Layout of an archive directory:
+
+- `segment-000001.log`, `segment-000002.log`, ...: append-only logs of
+  zlib-compressed pages. Each entry is a (length, crc32) header followed by the
+  compressed JSON `{"url_slug", "params", "fetched_at", "body"}`. A new segment is
+  started once the current one exceeds `segment_size` bytes.
+- `index.bin`: fixed-width records of (collection, segment, record id, updated_at,
+  offset), one per record in each page. The index is read through `mmap`, so
+  lookups and replays never load it into memory as Python objects.
+- `index.sorted.bin`: the same records sorted by (collection, record id,
+  updated_at), preceded by the number of `index.bin` records they cover. `find`
+  binary searches it and scans only the newer, unsorted tail of `index.bin`; once
+  that tail exceeds `SORTED_TAIL_RECORDS`, the sorted index is rebuilt.
+
+An archive directory expects a single writing process; appends within that process
+are thread-safe.
+
+Usage:
+    python whoop_archive.py ARCHIVE_DIR --collection sleep \\
+        --transform whoop_sleep:extract_sleep_data --output sleep_rows.json
+
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import importlib
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterator
+
+from whoop_time import parse_utc
+
+
+COLLECTIONS = ("other", "sleep", "cycle", "recovery", "workout")
+
+# url_slug prefix -> collection, most specific first
+_SLUG_COLLECTIONS = (
+    ("v1/activity/sleep", "sleep"),
+    ("v1/activity/workout", "workout"),
+    ("v1/recovery", "recovery"),
+    ("v1/cycle/", "cycle"),
+    ("v1/cycle", "cycle"),
+)
+
+_ENTRY_HEADER = struct.Struct("<II")
+_INDEX_RECORD = struct.Struct("<B3xIqqQ")
+_SORTED_HEADER = struct.Struct("<Q")
+
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+SORTED_TAIL_RECORDS = 10_000
+
+
+def collection_for(url_slug: str) -> str:
+    """Return the collection a WHOOP endpoint belongs to.
+
+    Args:
+        url_slug (str): Endpoint path, e.g. "v1/activity/sleep" or "v1/cycle/42".
+
+    Returns:
+        str: One of `COLLECTIONS`. Recoveries fetched via "v1/cycle/<id>/recovery"
+            are "recovery".
+    """
+    if url_slug.startswith("v1/cycle/") and url_slug.endswith("/recovery"):
+        return "recovery"
+
+    for prefix, collection in _SLUG_COLLECTIONS:
+        if url_slug.startswith(prefix):
+            return collection
+
+    return "other"
+
+
+def record_key(record: dict[str, Any]) -> int:
+    """Return the 64-bit index key of a record's ID.
+
+    Numeric IDs, including all-digit strings such as the IDs in webhook events, are
+    used as-is; anything else (e.g. UUIDs) is hashed.
+
+    Args:
+        record (dict[str, Any]): A WHOOP record. Recoveries are keyed by `cycle_id`.
+
+    Returns:
+        int: Signed 64-bit key.
+    """
+    record_id = record.get("id", record.get("cycle_id", 0))
+    if isinstance(record_id, int):
+        return record_id
+    if isinstance(record_id, str) and record_id.isascii() and record_id.isdigit():
+        if int(record_id) < 2**63:
+            return int(record_id)
+
+    digest = hashlib.blake2b(str(record_id).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+def _updated_at_ms(record: dict[str, Any]) -> int:
+    updated_at = record.get("updated_at") or record.get("created_at")
+    if not updated_at:
+        return 0
+    return int(parse_utc(updated_at).timestamp() * 1000)
+
+
+class PageArchive:
+    """Append-only, compressed archive of raw WHOOP API pages.
+
+    Attributes:
+        directory (str): Directory holding the segments and index.
+        segment_size (int): Size in bytes after which a new segment is started.
+    """
+
+    def __init__(self, directory: str, segment_size: int = DEFAULT_SEGMENT_SIZE):
+        """Open an archive, creating the directory if needed.
+
+        Args:
+            directory (str): Archive directory.
+            segment_size (int): Size in bytes after which a new segment is started.
+                Defaults to 64 MiB.
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._index_path = os.path.join(directory, "index.bin")
+        self._truncate_partial_index()
+
+        segments = sorted(
+            int(name[8:14])
+            for name in os.listdir(directory)
+            if name.startswith("segment-") and name.endswith(".log")
+        )
+        self._segment = segments[-1] if segments else 1
+
+    ####################################################################################
+    # WRITING
+
+    def append(
+        self, url_slug: str, params: dict[str, Any] | None, body: dict[str, Any]
+    ) -> int:
+        """Append one API response page to the archive.
+
+        Args:
+            url_slug (str): Endpoint the page was fetched from.
+            params (dict[str, Any], optional): Query parameters of the request.
+            body (dict[str, Any]): Decoded JSON response.
+
+        Returns:
+            int: Number of records indexed from the page.
+        """
+        collection = collection_for(url_slug)
+        records = body.get("records", [body] if collection != "other" else [])
+        payload = zlib.compress(
+            json.dumps(
+                {
+                    "url_slug": url_slug,
+                    "params": params or {},
+                    "fetched_at": datetime.now(timezone.utc).isoformat(),
+                    "body": body,
+                },
+                separators=(",", ":"),
+            ).encode("utf-8")
+        )
+
+        with self._lock:
+            path = self._segment_path(self._segment)
+            if os.path.exists(path) and os.path.getsize(path) >= self.segment_size:
+                self._segment += 1
+                path = self._segment_path(self._segment)
+
+            with open(path, "ab") as segment:
+                offset = segment.tell()
+                segment.write(_ENTRY_HEADER.pack(len(payload), zlib.crc32(payload)))
+                segment.write(payload)
+
+            # Pages without records (e.g. the profile) are kept in the segment log
+            # but not indexed.
+            with open(self._index_path, "ab") as index:
+                index.write(
+                    b"".join(
+                        _INDEX_RECORD.pack(
+                            COLLECTIONS.index(collection),
+                            self._segment,
+                            record_key(record),
+                            _updated_at_ms(record),
+                            offset,
+                        )
+                        for record in records
+                    )
+                )
+
+        return len(records)
+
+    ####################################################################################
+    # READING
+
+    def find(self, collection: str, record_id: Any) -> dict[str, Any] | None:
+        """Return the most recently updated archived version of a record.
+
+        The sorted index is binary searched and only the unsorted tail of the index
+        is scanned, so a lookup costs O(log N + SORTED_TAIL_RECORDS) index reads.
+
+        Args:
+            collection (str): One of `COLLECTIONS`.
+            record_id (Any): The record's ID (`cycle_id` for recoveries).
+
+        Returns:
+            dict[str, Any] | None: The raw record, or `None` if it is not archived.
+        """
+        code = COLLECTIONS.index(collection)
+        key = record_key({"id": record_id})
+
+        covered = self._sorted_count()
+        if self._index_count() - covered > SORTED_TAIL_RECORDS:
+            covered = self._rebuild_sorted_index()
+
+        best = self._find_sorted(code, key)
+        for entry in self._iter_index(start=covered):
+            if entry[0] == code and entry[2] == key:
+                if best is None or entry[3] >= best[3]:
+                    best = entry
+
+        if best is None:
+            return None
+
+        page = self._read_entry(best[1], best[4])
+        return next(
+            (record for record in _page_records(page) if record_key(record) == key),
+            None,
+        )
+
+    def replay(
+        self, collection: str, latest_only: bool = True
+    ) -> Iterator[dict[str, Any]]:
+        """Yield archived raw records of one collection without touching the network.
+
+        Args:
+            collection (str): One of `COLLECTIONS` other than "other".
+            latest_only (bool): Yield only the most recently updated version of each
+                record. Defaults to true.
+
+        Yields:
+            dict[str, Any]: Raw records, in archive order.
+        """
+        code = COLLECTIONS.index(collection)
+        latest: dict[int, tuple[int, int, int]] = {}
+        order = []
+
+        for entry in self._iter_index():
+            if entry[0] != code:
+                continue
+            _, segment, key, updated_at, offset = entry
+            if not latest_only:
+                order.append((segment, offset, key))
+            elif key not in latest or updated_at >= latest[key][0]:
+                latest[key] = (updated_at, segment, offset)
+
+        if latest_only:
+            order = sorted(
+                (segment, offset, key)
+                for key, (_, segment, offset) in latest.items()
+            )
+
+        page_cache: tuple[tuple[int, int], dict[int, dict[str, Any]]] | None = None
+        for segment, offset, key in order:
+            if page_cache is None or page_cache[0] != (segment, offset):
+                page = self._read_entry(segment, offset)
+                page_cache = (
+                    (segment, offset),
+                    {record_key(record): record for record in _page_records(page)},
+                )
+            if record := page_cache[1].get(key):
+                yield record
+
+    def pages(self) -> Iterator[dict[str, Any]]:
+        """Yield every archived page in the order it was appended.
+
+        Yields:
+            dict[str, Any]: Page with `url_slug`, `params`, `fetched_at` and `body`.
+        """
+        segment = 1
+        while os.path.exists(path := self._segment_path(segment)):
+            with open(path, "rb") as file:
+                while header := file.read(_ENTRY_HEADER.size):
+                    length, crc = _ENTRY_HEADER.unpack(header)
+                    payload = file.read(length)
+                    if len(payload) < length or zlib.crc32(payload) != crc:
+                        break
+                    yield json.loads(zlib.decompress(payload))
+            segment += 1
+
+    ####################################################################################
+    # HELPERS
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"segment-{segment:06d}.log")
+
+    def _truncate_partial_index(self) -> None:
+        if not os.path.exists(self._index_path):
+            return
+        size = os.path.getsize(self._index_path)
+        if size % _INDEX_RECORD.size:
+            with open(self._index_path, "r+b") as index:
+                index.truncate(size - size % _INDEX_RECORD.size)
+
+    def _iter_index(self, start: int = 0) -> Iterator[tuple[int, int, int, int, int]]:
+        if not os.path.exists(self._index_path):
+            return
+        with open(self._index_path, "rb") as index:
+            size = os.fstat(index.fileno()).st_size
+            size -= size % _INDEX_RECORD.size
+            if size <= start * _INDEX_RECORD.size:
+                return
+            with mmap.mmap(index.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                unpack_from = _INDEX_RECORD.unpack_from
+                for position in range(
+                    start * _INDEX_RECORD.size, size, _INDEX_RECORD.size
+                ):
+                    yield unpack_from(mapped, position)
+
+    def _index_count(self) -> int:
+        if not os.path.exists(self._index_path):
+            return 0
+        return os.path.getsize(self._index_path) // _INDEX_RECORD.size
+
+    def _sorted_path(self) -> str:
+        return os.path.join(self.directory, "index.sorted.bin")
+
+    def _sorted_count(self) -> int:
+        if not os.path.exists(self._sorted_path()):
+            return 0
+        with open(self._sorted_path(), "rb") as file:
+            header = file.read(_SORTED_HEADER.size)
+        return _SORTED_HEADER.unpack(header)[0] if header else 0
+
+    def _rebuild_sorted_index(self) -> int:
+        entries = sorted(
+            self._iter_index(), key=lambda entry: (entry[0], entry[2], entry[3])
+        )
+        # Readers may rebuild concurrently, so each writes its own temporary file
+        tmp_path = f"{self._sorted_path()}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(_SORTED_HEADER.pack(len(entries)))
+            file.writelines(_INDEX_RECORD.pack(*entry) for entry in entries)
+        os.replace(tmp_path, self._sorted_path())
+        return len(entries)
+
+    def _find_sorted(
+        self, code: int, key: int
+    ) -> tuple[int, int, int, int, int] | None:
+        if not os.path.exists(self._sorted_path()):
+            return None
+        with open(self._sorted_path(), "rb") as file, mmap.mmap(
+            file.fileno(), 0, access=mmap.ACCESS_READ
+        ) as mapped:
+            count = (len(mapped) - _SORTED_HEADER.size) // _INDEX_RECORD.size
+
+            def entry_at(position: int) -> tuple[int, int, int, int, int]:
+                return _INDEX_RECORD.unpack_from(
+                    mapped, _SORTED_HEADER.size + position * _INDEX_RECORD.size
+                )
+
+            # Last entry with (collection, key) <= (code, key); versions of a record
+            # are sorted by updated_at, so that is its newest
+            low, high = 0, count
+            while low < high:
+                middle = (low + high) // 2
+                entry = entry_at(middle)
+                if (entry[0], entry[2]) <= (code, key):
+                    low = middle + 1
+                else:
+                    high = middle
+            if low:
+                entry = entry_at(low - 1)
+                if (entry[0], entry[2]) == (code, key):
+                    return entry
+        return None
+
+    def _read_entry(self, segment: int, offset: int) -> dict[str, Any]:
+        with open(self._segment_path(segment), "rb") as file:
+            file.seek(offset)
+            length, crc = _ENTRY_HEADER.unpack(file.read(_ENTRY_HEADER.size))
+            payload = file.read(length)
+
+        if zlib.crc32(payload) != crc:
+            raise ValueError(f"Corrupt archive entry at segment {segment}:{offset}")
+
+        return json.loads(zlib.decompress(payload))
+
+
+def _page_records(page: dict[str, Any]) -> list[dict[str, Any]]:
+    body = page["body"]
+    return body.get("records", [body])
+
+
+def _load_callable(spec: str) -> Callable[..., Any]:
+    module, _, name = spec.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def main() -> None:
+    """Replay an archived collection through a transform from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("archive", help="archive directory")
+    parser.add_argument("--collection", required=True, choices=COLLECTIONS[1:])
+    parser.add_argument(
+        "--transform",
+        help="module:function taking a list of raw records, e.g. "
+        "whoop_sleep:extract_sleep_data",
+    )
+    parser.add_argument("--output", required=True, help="JSON file to write")
+    parser.add_argument(
+        "--all-versions",
+        action="store_true",
+        help="replay every archived version instead of only the latest",
+    )
+    args = parser.parse_args()
+
+    archive = PageArchive(args.archive)
+    records = list(archive.replay(args.collection, latest_only=not args.all_versions))
+    if args.transform:
+        records = _load_callable(args.transform)(records)
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(records, file)
+
+    print(f"Replayed {len(records)} {args.collection} records into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+"""Resumable historical backfill of WHOOP sleep, cycle, recovery and workout data.
+
+The history is split into month-sized jobs per collection. Jobs are pulled from a
+shared queue by a pool of workers, each with its own HTTP connection, so a worker
+that finishes a sparse month immediately picks up the next one. Every completed job
+is checkpointed to disk; rerunning the backfill skips those and only retries the
+months that are missing. Jobs that end today or later are always rerun, since their
+month is still open. Once every job is done the checkpoints are merged into one
+file per collection.
+
+Usage:
+    python whoop_backfill.py --start 2021-01-01 --output-dir backfill --workers 8
+
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Callable
+
+from whoop_archive import PageArchive
+from whoop_sleep import WhoopClient, extract_sleep_data, password, username
+
+
+COLLECTIONS: dict[str, Callable[[WhoopClient, str, str], list[dict[str, Any]]]] = {
+    "sleep": WhoopClient.get_sleep_collection,
+    "cycle": WhoopClient.get_cycle_collection,
+    "recovery": WhoopClient.get_recovery_collection,
+    "workout": WhoopClient.get_workout_collection,
+}
+
+
+@dataclass(frozen=True)
+class BackfillJob:
+    """One collection over one month of history."""
+
+    collection: str
+    start_date: str
+    end_date: str
+
+    @property
+    def month(self) -> str:
+        """str: Month covered by the job (YYYY-MM)."""
+        return self.start_date[:7]
+
+
+def month_jobs(
+    start: date, end: date, collections: list[str] | None = None
+) -> list[BackfillJob]:
+    """Split a date range into month-sized jobs for each collection.
+
+    Args:
+        start (date): First date to backfill.
+        end (date): Last date to backfill.
+        collections (list[str], optional): Collections to include. Defaults to all of
+            `COLLECTIONS`.
+
+    Returns:
+        list[BackfillJob]: Jobs ordered newest month first.
+
+    Raises:
+        ValueError: If `start` is after `end` or a collection is unknown.
+    """
+    if start > end:
+        raise ValueError(f"Start date greater than end date: {start} > {end}")
+
+    collections = collections or list(COLLECTIONS)
+    if unknown := set(collections) - set(COLLECTIONS):
+        raise ValueError(f"Unknown collections: {sorted(unknown)}")
+
+    jobs = []
+    month_start = start.replace(day=1)
+    while month_start <= end:
+        next_month = (month_start + timedelta(days=32)).replace(day=1)
+        job_start = max(month_start, start)
+        job_end = min(next_month - timedelta(days=1), end)
+
+        jobs.extend(
+            BackfillJob(collection, job_start.isoformat(), job_end.isoformat())
+            for collection in collections
+        )
+        month_start = next_month
+
+    return sorted(jobs, key=lambda job: job.start_date, reverse=True)
+
+
+class Backfill:
+    """Run backfill jobs on a worker pool with on-disk checkpoints.
+
+    Attributes:
+        output_dir (str): Directory for checkpoints and merged output.
+        workers (int): Number of concurrent workers.
+    """
+
+    def __init__(
+        self,
+        client: WhoopClient,
+        output_dir: str,
+        workers: int = 8,
+    ):
+        """Initialize a backfill.
+
+        Args:
+            client (WhoopClient): Authenticated client whose token is shared with the
+                per-worker clients.
+            output_dir (str): Directory for checkpoints and merged output.
+            workers (int): Number of concurrent workers. Defaults to 8.
+        """
+        self.output_dir = output_dir
+        self.workers = workers
+        self._client = client
+        self._local = threading.local()
+        self._clients: list[WhoopClient] = []
+        self._clients_lock = threading.Lock()
+
+    def checkpoint_path(self, job: BackfillJob) -> str:
+        """Return the checkpoint file for a job.
+
+        Args:
+            job (BackfillJob): The job.
+
+        Returns:
+            str: Path of the job's checkpoint file.
+        """
+        return os.path.join(
+            self.output_dir,
+            ".checkpoints",
+            job.collection,
+            f"{job.start_date}_{job.end_date}.json",
+        )
+
+    def run(self, jobs: list[BackfillJob]) -> list[tuple[BackfillJob, str]]:
+        """Run every job that has no checkpoint yet and merge the results.
+
+        Args:
+            jobs (list[BackfillJob]): Jobs to run.
+
+        Returns:
+            list[tuple[BackfillJob, str]]: Failed jobs and their error messages.
+                Empty if the backfill is complete.
+        """
+        today = date.today().isoformat()
+        pending = [
+            job
+            for job in jobs
+            if job.end_date >= today or not os.path.exists(self.checkpoint_path(job))
+        ]
+        print(f"{len(jobs) - len(pending)}/{len(jobs)} jobs already checkpointed")
+
+        failures = []
+        started = time.perf_counter()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {executor.submit(self._run_job, job): job for job in pending}
+
+                for done, future in enumerate(as_completed(futures), start=1):
+                    job = futures[future]
+                    try:
+                        count = future.result()
+                    except Exception as e:  # noqa: B902 - retried on the next run
+                        failures.append((job, f"{type(e).__name__}: {e}"))
+                        print(f"[{done}/{len(pending)}] {job} failed: {e}")
+                    else:
+                        print(f"[{done}/{len(pending)}] {job}: {count} records")
+        finally:
+            for client in self._clients:
+                client.close()
+
+        print(f"Ran {len(pending)} jobs in {time.perf_counter() - started:.1f}s")
+
+        if not failures:
+            self.merge(jobs)
+
+        return failures
+
+    def merge(self, jobs: list[BackfillJob]) -> None:
+        """Merge checkpointed jobs into one JSON file per collection.
+
+        Records are de-duplicated by ID, since records that span a month boundary
+        are returned by both months. Sleep is additionally written as a CSV in the
+        same shape as `fetch_historical_sleep_data.py`.
+
+        Args:
+            jobs (list[BackfillJob]): Jobs whose checkpoints should be merged.
+        """
+        by_collection: dict[str, dict[Any, dict[str, Any]]] = {}
+
+        for job in jobs:
+            with open(self.checkpoint_path(job), encoding="utf-8") as file:
+                records = json.load(file)
+
+            merged = by_collection.setdefault(job.collection, {})
+            for record in records:
+                merged[record.get("id", record.get("cycle_id"))] = record
+
+        for collection, merged in by_collection.items():
+            records = list(merged.values())
+            output_file = save_collection(self.output_dir, collection, records)
+            print(f"{len(records)} {collection} records saved to {output_file}")
+
+            if collection == "sleep":
+                self._write_sleep_csv(records)
+
+    def _write_sleep_csv(self, records: list[dict[str, Any]]) -> None:
+        records = sorted(records, key=_record_start, reverse=True)
+        rows = extract_sleep_data(records)
+        if not rows:
+            return
+
+        output_file = os.path.join(self.output_dir, "whoop_sleep_data.csv")
+        with open(output_file, "w", encoding="utf-8", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+    def _run_job(self, job: BackfillJob) -> int:
+        records = COLLECTIONS[job.collection](
+            self._worker_client(), job.start_date, job.end_date
+        )
+
+        path = self.checkpoint_path(job)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+            json.dump(records, file)
+        os.replace(f"{path}.tmp", path)
+
+        return len(records)
+
+    def _worker_client(self) -> WhoopClient:
+        if client := getattr(self._local, "client", None):
+            return client
+
+        client = WhoopClient(
+            self._client._username, self._client._password, authenticate=False
+        )
+        client.session.token = self._client.session.token
+        client.user_id = self._client.user_id
+        client.archive = self._client.archive
+
+        self._local.client = client
+        with self._clients_lock:
+            self._clients.append(client)
+
+        return client
+
+
+def save_collection(
+    output_dir: str, collection: str, records: list[dict[str, Any]]
+) -> str:
+    """Write a collection, newest first, to `<output_dir>/<collection>.json`.
+
+    The file is replaced atomically, since `whoop_read_service` may be reading it.
+
+    Args:
+        output_dir (str): Directory of the collection files.
+        collection (str): Name of the collection.
+        records (list[dict[str, Any]]): Every record of the collection.
+
+    Returns:
+        str: Path of the written file.
+    """
+    output_file = os.path.join(output_dir, f"{collection}.json")
+    os.makedirs(output_dir, exist_ok=True)
+
+    with open(f"{output_file}.tmp", "w", encoding="utf-8") as file:
+        json.dump(sorted(records, key=_record_start, reverse=True), file)
+    os.replace(f"{output_file}.tmp", output_file)
+
+    return output_file
+
+
+def update_collection(
+    output_dir: str,
+    collection: str,
+    records: list[dict[str, Any]],
+    deleted_ids: list[str] | None = None,
+) -> int:
+    """Merge changed and deleted records into a collection file.
+
+    Args:
+        output_dir (str): Directory of the collection files.
+        collection (str): Name of the collection.
+        records (list[dict[str, Any]]): New or updated records.
+        deleted_ids (list[str], optional): IDs of deleted records.
+
+    Returns:
+        int: Number of records in the updated file.
+    """
+    path = os.path.join(output_dir, f"{collection}.json")
+    existing = []
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as file:
+            existing = json.load(file)
+
+    merged = {_record_id(record): record for record in existing}
+    for record_id in deleted_ids or []:
+        merged.pop(str(record_id), None)
+    for record in records:
+        merged[_record_id(record)] = record
+
+    save_collection(output_dir, collection, list(merged.values()))
+
+    return len(merged)
+
+
+def _record_id(record: dict[str, Any]) -> str:
+    return str(record.get("id", record.get("cycle_id")))
+
+
+def _record_start(record: dict[str, Any]) -> str:
+    return record.get("start", record.get("created_at", ""))
+
+
+def main() -> None:
+    """Run the backfill from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--start", required=True, help="first date (YYYY-MM-DD)")
+    parser.add_argument("--end", default=date.today().isoformat())
+    parser.add_argument("--output-dir", default="backfill")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument(
+        "--collections", nargs="+", choices=list(COLLECTIONS), default=None
+    )
+    parser.add_argument(
+        "--archive-dir", help="also append every raw page to this PageArchive"
+    )
+    args = parser.parse_args()
+
+    jobs = month_jobs(
+        date.fromisoformat(args.start), date.fromisoformat(args.end), args.collections
+    )
+
+    with WhoopClient(username, password, authenticate=False) as client:
+        if args.archive_dir:
+            client.archive = PageArchive(args.archive_dir)
+        client.authenticate()
+        failures = Backfill(client, args.output_dir, workers=args.workers).run(jobs)
+
+    if failures:
+        print(f"{len(failures)} jobs failed; rerun to retry them")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+"""Cross-metric correlation and lag analysis over WHOOP history.
+
+Sleep, cycle, recovery and workout records are aligned into one day-indexed NumPy
+matrix (days x metrics, NaN where a metric has no data). Every analysis then runs as a
+handful of batched array operations instead of per-day Python loops:
+
+- `lagged_correlation` answers questions such as "does high strain lower the next
+  day's HRV?" for every pair of metrics and every lag at once,
+- `rolling_regression` fits y = slope * x + intercept over a trailing window, and
+- `zone_histogram` bins heart rate zone durations across all workouts.
+
+Matrices for several users can be stacked into a (users x days x metrics) array; lags
+and windows never cross from one user into the next.
+
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Callable, Iterable
+
+import numpy as np
+
+from whoop_time import to_local
+
+
+ZONES = ("zero", "one", "two", "three", "four", "five")
+
+# metric -> (collection, timestamp field, extractor, daily aggregation)
+METRICS: dict[str, tuple[str, str, Callable[[dict[str, Any]], Any], str]] = {
+    "sleep_performance_percentage": (
+        "sleep",
+        "end",
+        lambda score: score.get("sleep_performance_percentage"),
+        "mean",
+    ),
+    "total_rem_sleep_time_milli": (
+        "sleep",
+        "end",
+        lambda score: score["stage_summary"]["total_rem_sleep_time_milli"],
+        "sum",
+    ),
+    "total_slow_wave_sleep_time_milli": (
+        "sleep",
+        "end",
+        lambda score: score["stage_summary"]["total_slow_wave_sleep_time_milli"],
+        "sum",
+    ),
+    "strain": ("cycle", "start", lambda score: score.get("strain"), "mean"),
+    "kilojoule": ("cycle", "start", lambda score: score.get("kilojoule"), "mean"),
+    "recovery_score": (
+        "recovery",
+        "start",
+        lambda score: score.get("recovery_score"),
+        "mean",
+    ),
+    "hrv_rmssd_milli": (
+        "recovery",
+        "start",
+        lambda score: score.get("hrv_rmssd_milli"),
+        "mean",
+    ),
+    "resting_heart_rate": (
+        "recovery",
+        "start",
+        lambda score: score.get("resting_heart_rate"),
+        "mean",
+    ),
+    **{
+        f"zone_{zone}_milli": (
+            "workout",
+            "start",
+            lambda score, zone=zone: score["zone_duration"][f"zone_{zone}_milli"],
+            "sum",
+        )
+        for zone in ZONES
+    },
+}
+
+
+@dataclass
+class DailyMatrix:
+    """WHOOP metrics aligned on local calendar days.
+
+    Attributes:
+        days (np.ndarray): Local dates as `datetime64[D]`, one per row.
+        columns (list[str]): Metric name of each column.
+        values (np.ndarray): Float array of shape (days, metrics). Missing values are
+            NaN.
+    """
+
+    days: np.ndarray
+    columns: list[str]
+    values: np.ndarray
+
+    def column(self, name: str) -> np.ndarray:
+        """Return one metric as a 1-D array.
+
+        Args:
+            name (str): Metric name.
+
+        Returns:
+            np.ndarray: Values of the metric for every day.
+        """
+        return self.values[:, self.columns.index(name)]
+
+
+def align_daily(
+    sleeps: Iterable[dict[str, Any]] = (),
+    cycles: Iterable[dict[str, Any]] = (),
+    recoveries: Iterable[dict[str, Any]] = (),
+    workouts: Iterable[dict[str, Any]] = (),
+    columns: list[str] | None = None,
+    start: date | None = None,
+    end: date | None = None,
+) -> DailyMatrix:
+    """Align all four WHOOP collections into one day-indexed matrix.
+
+    Sleeps are keyed by the local day they ended on and cycles and workouts by the
+    local day they started on. Recoveries are keyed by the local start day of their
+    cycle, or by the UTC day they were created if their cycle is not given. Days
+    with several records (naps, multiple workouts) are averaged or summed depending
+    on the metric.
+
+    Args:
+        sleeps (Iterable[dict[str, Any]], optional): Sleep records.
+        cycles (Iterable[dict[str, Any]], optional): Cycle records.
+        recoveries (Iterable[dict[str, Any]], optional): Recovery records.
+        workouts (Iterable[dict[str, Any]], optional): Workout records.
+        columns (list[str], optional): Metrics to include. Defaults to all of
+            `METRICS`.
+        start (date, optional): First day of the matrix. Defaults to the earliest
+            record.
+        end (date, optional): Last day of the matrix. Defaults to the latest record.
+
+    Returns:
+        DailyMatrix: The aligned matrix.
+
+    Raises:
+        ValueError: If a requested metric is unknown.
+    """
+    columns = columns or list(METRICS)
+    if unknown := set(columns) - set(METRICS):
+        raise ValueError(f"Unknown metrics: {sorted(unknown)}")
+
+    cycles = list(cycles)
+    collections = {
+        "sleep": list(sleeps),
+        "cycle": cycles,
+        "recovery": _with_cycle_start(recoveries, cycles),
+        "workout": list(workouts),
+    }
+
+    day_cols: list[np.ndarray] = []
+    metric_cols: list[np.ndarray] = []
+    value_cols: list[np.ndarray] = []
+
+    for col, name in enumerate(columns):
+        collection, field, extract, _ = METRICS[name]
+        days, values = _extract(collections[collection], field, extract)
+        day_cols.append(days)
+        metric_cols.append(np.full(len(days), col))
+        value_cols.append(values)
+
+    all_days = np.concatenate(day_cols)
+    if not all_days.size and not (start or end):
+        return DailyMatrix(
+            np.array([], "datetime64[D]"), columns, np.empty((0, len(columns)))
+        )
+
+    if all_days.size:
+        first = np.datetime64(start, "D") if start else all_days.min()
+        last = np.datetime64(end, "D") if end else all_days.max()
+        # A bound taken from the data must not fall on the wrong side of a given one
+        if not start:
+            first = min(first, last)
+        if not end:
+            last = max(last, first)
+    else:
+        first = np.datetime64(start or end, "D")
+        last = np.datetime64(end or start, "D")
+
+    n_days = int((last - first).astype(int)) + 1
+    rows = (all_days - first).astype(int)
+    cols = np.concatenate(metric_cols)
+    values = np.concatenate(value_cols)
+
+    keep = (rows >= 0) & (rows < n_days) & ~np.isnan(values)
+    rows, cols, values = rows[keep], cols[keep], values[keep]
+
+    sums = np.zeros((n_days, len(columns)))
+    counts = np.zeros((n_days, len(columns)))
+    np.add.at(sums, (rows, cols), values)
+    np.add.at(counts, (rows, cols), 1)
+
+    means = np.array([METRICS[name][3] == "mean" for name in columns])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        matrix = np.where(means, sums / counts, sums)
+    matrix[counts == 0] = np.nan
+
+    return DailyMatrix(
+        days=first + np.arange(n_days),
+        columns=columns,
+        values=matrix,
+    )
+
+
+def lagged_correlation(values: np.ndarray, max_lag: int = 7) -> np.ndarray:
+    """Compute Pearson correlations between every pair of metrics at every lag.
+
+    `result[lag, i, j]` is the correlation of metric `i` on day `t` with metric `j`
+    on day `t + lag`, using only days where both values are present.
+
+    Args:
+        values (np.ndarray): Matrix of shape (days, metrics), or a stack of
+            per-user matrices of shape (users, days, metrics).
+        max_lag (int): Largest lag in days. Defaults to 7.
+
+    Returns:
+        np.ndarray: Array of shape (max_lag + 1, metrics, metrics). Pairs with fewer
+            than two overlapping days are NaN.
+    """
+    stacked = values if values.ndim == 3 else values[np.newaxis]
+    n_metrics = stacked.shape[2]
+    result = np.full((max_lag + 1, n_metrics, n_metrics), np.nan)
+
+    for lag in range(min(max_lag, stacked.shape[1] - 1) + 1):
+        leading = stacked[:, : stacked.shape[1] - lag].reshape(-1, n_metrics)
+        lagging = stacked[:, lag:].reshape(-1, n_metrics)
+        result[lag] = _pairwise_corr(leading, lagging)
+
+    return result
+
+
+def rolling_regression(
+    x: np.ndarray, y: np.ndarray, window: int = 30, min_periods: int = 7
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Fit y = slope * x + intercept over a trailing window ending on each day.
+
+    Days where either value is NaN are left out of the fit.
+
+    Args:
+        x (np.ndarray): Predictor, shape (days,) or (users, days).
+        y (np.ndarray): Response, same shape as `x`.
+        window (int): Window length in days. Defaults to 30.
+        min_periods (int): Minimum number of paired values for a fit. Defaults to 7.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: Slope, intercept and R² for each
+            day, NaN where there is not enough data.
+    """
+    mask = ~(np.isnan(x) | np.isnan(y))
+    x0 = np.where(mask, x, 0.0)
+    y0 = np.where(mask, y, 0.0)
+
+    n = _window_sum(mask.astype(float), window)
+    sx = _window_sum(x0, window)
+    sy = _window_sum(y0, window)
+    sxx = _window_sum(x0 * x0, window)
+    syy = _window_sum(y0 * y0, window)
+    sxy = _window_sum(x0 * y0, window)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = n * sxy - sx * sy
+        var_x = n * sxx - sx * sx
+        var_y = n * syy - sy * sy
+        slope = cov / var_x
+        intercept = (sy - slope * sx) / n
+        r_squared = cov * cov / (var_x * var_y)
+
+    invalid = (n < min_periods) | (var_x <= 0)
+    for array in (slope, intercept, r_squared):
+        array[invalid] = np.nan
+
+    return slope, intercept, r_squared
+
+
+def zone_histogram(
+    workouts: Iterable[dict[str, Any]], bins: np.ndarray | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """Histogram the time spent in each heart rate zone across workouts.
+
+    Args:
+        workouts (Iterable[dict[str, Any]]): Workout records.
+        bins (np.ndarray, optional): Bin edges in minutes. Defaults to 5-minute bins
+            up to two hours.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Counts of shape (zones, bins - 1) and the bin
+            edges.
+    """
+    bins = np.arange(0, 125, 5) if bins is None else np.asarray(bins)
+    durations = np.array(
+        [
+            [
+                (record["score"]["zone_duration"].get(f"zone_{zone}_milli") or 0)
+                for zone in ZONES
+            ]
+            for record in workouts
+            if (record.get("score") or {}).get("zone_duration")
+        ],
+        dtype=float,
+    ).reshape(-1, len(ZONES))
+    minutes = durations.T / 60_000
+
+    n_bins = len(bins) - 1
+    bin_index = np.searchsorted(bins, minutes, side="right") - 1
+    # Values equal to the last edge belong in the last bin, as in np.histogram
+    bin_index[minutes == bins[-1]] = n_bins - 1
+    in_range = (bin_index >= 0) & (bin_index < n_bins)
+
+    zone_index = np.broadcast_to(np.arange(len(ZONES))[:, np.newaxis], minutes.shape)
+    counts = np.bincount(
+        zone_index[in_range] * n_bins + bin_index[in_range],
+        minlength=len(ZONES) * n_bins,
+    ).reshape(len(ZONES), n_bins)
+
+    return counts, bins
+
+
+def _extract(
+    records: list[dict[str, Any]],
+    field: str,
+    extract: Callable[[dict[str, Any]], Any],
+) -> tuple[np.ndarray, np.ndarray]:
+    days = []
+    values = []
+    for record in records:
+        score = record.get("score")
+        if not score or field not in record:
+            continue
+        try:
+            value = extract(score)
+        except (KeyError, TypeError):
+            continue
+        if value is None:
+            continue
+        days.append(to_local(record[field], record["timezone_offset"]).date())
+        values.append(value)
+
+    return np.array(days, dtype="datetime64[D]"), np.array(values, dtype=float)
+
+
+def _with_cycle_start(
+    recoveries: Iterable[dict[str, Any]], cycles: list[dict[str, Any]]
+) -> list[dict[str, Any]]:
+    starts = {
+        cycle["id"]: (cycle["start"], cycle["timezone_offset"]) for cycle in cycles
+    }
+    dated = []
+    for record in recoveries:
+        if record.get("cycle_id") in starts:
+            start, offset = starts[record["cycle_id"]]
+        elif record.get("created_at"):
+            # Same fallback as whoop_rollups and whoop_read_service
+            start, offset = record["created_at"], "+00:00"
+        else:
+            continue
+        dated.append({**record, "start": start, "timezone_offset": offset})
+
+    return dated
+
+
+def _pairwise_corr(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    mask_a = ~np.isnan(a)
+    mask_b = ~np.isnan(b)
+    a0 = np.where(mask_a, a, 0.0)
+    b0 = np.where(mask_b, b, 0.0)
+    ma = mask_a.astype(float)
+    mb = mask_b.astype(float)
+
+    # Sums over the rows where both a[:, i] and b[:, j] are present, for all i, j
+    n = ma.T @ mb
+    sa = a0.T @ mb
+    sb = ma.T @ b0
+    saa = (a0 * a0).T @ mb
+    sbb = ma.T @ (b0 * b0)
+    sab = a0.T @ b0
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        corr = (n * sab - sa * sb) / np.sqrt((n * saa - sa * sa) * (n * sbb - sb * sb))
+    corr[n < 2] = np.nan
+
+    return corr
+
+
+def _window_sum(values: np.ndarray, window: int) -> np.ndarray:
+    cumsum = np.cumsum(values, axis=-1)
+    shifted = np.zeros_like(cumsum)
+    shifted[..., window:] = cumsum[..., :-window]
+    return cumsum - shifted
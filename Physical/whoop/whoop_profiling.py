@@ -0,0 +1,467 @@
+"""Profiling harness for the ingestion entry points.
+
+Any script, module or function can be launched under the profiler:
+
+    python whoop_profiling.py run whoop_sleep:run_whoop_sleep {} null
+    python whoop_profiling.py run fetch_historical_sleep_data.py
+    python whoop_profiling.py run ../../Gravity/youtube_dashboard.py
+    python whoop_profiling.py run -m whoop_backfill --start 2024-01-01
+
+Each run captures:
+
+- cProfile call stats for the main thread and every thread it starts (so request
+  handlers of a threaded Flask server are included; before Python 3.12 each thread
+  gets its own profiler, from 3.12 on the single profiler covers every thread),
+- tracemalloc peak memory, with a snapshot of the top allocation sites taken at the
+  end of the span that raised the peak, and
+- wall-clock spans. Code marks them with `span("network")`, `span("json_decode")`,
+  `span("transform")`, `span("sink:airtable")`, ... Spans nest, and the part of a
+  name before ":" is its category. They cost one global lookup when no profiler is
+  active.
+
+A run writes a directory `<output-dir>/<label>-<timestamp>/` containing
+`profile.pstats`, `functions.collapsed` and `spans.collapsed` (collapsed stacks in
+microseconds, for flamegraph.pl or speedscope), and `summary.json`. Summaries of two
+runs are compared with:
+
+    python whoop_profiling.py compare profiles/run-a profiles/run-b
+
+Long-running targets such as the Flask apps are profiled until they exit or are
+interrupted with Ctrl-C.
+
+"""
+
+from __future__ import annotations
+
+import contextlib
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Callable, Iterator
+
+# Imported by whoop_sleep for its spans, so everything only the launcher needs
+# (argparse, json, cProfile, tracemalloc, ...) is imported lazily.
+
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 20
+PEAK_SNAPSHOT_GROWTH = 1.1
+MIN_COLLAPSED_SECONDS = 1e-4
+
+_active: Profiler | None = None
+_null_span = contextlib.nullcontext()
+
+
+def span(name: str) -> contextlib.AbstractContextManager[Any]:
+    """Time a block as a named span of the active profiler, if any.
+
+    Args:
+        name (str): Span name, optionally prefixed with a category ("sink:airtable").
+
+    Returns:
+        contextlib.AbstractContextManager[Any]: Context manager for the block.
+    """
+    if _active is None:
+        return _null_span
+    return _active.span(name)
+
+
+class Profiler:
+    """Collect cProfile stats, tracemalloc peaks and wall-clock spans for one run.
+
+    Attributes:
+        label (str): Name of the profiled target.
+        trace_memory (bool): Whether tracemalloc is enabled.
+    """
+
+    def __init__(self, label: str, trace_memory: bool = True):
+        """Initialize a profiler. Nothing is recorded until `start`.
+
+        Args:
+            label (str): Name of the profiled target.
+            trace_memory (bool): Enable tracemalloc. Defaults to true.
+        """
+        self.label = label
+        self.trace_memory = trace_memory
+        self._profiles: list[Any] = []
+        self._spans: dict[str, list[float]] = defaultdict(lambda: [0, 0.0, 0.0, 0.0])
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._snapshot: Any = None
+        self._snapshot_peak = 0
+        self._peak = 0
+        self._started_at = ""
+        self._started = 0.0
+        self._wall_seconds = 0.0
+
+    def start(self) -> None:
+        """Start profiling the current thread and every thread started afterwards."""
+        global _active  # pylint: disable=global-statement
+        import cProfile
+        import tracemalloc
+
+        if self.trace_memory:
+            tracemalloc.start()
+
+        def _profile_thread(*_args: Any) -> None:
+            profile = cProfile.Profile()
+            with self._lock:
+                self._profiles.append(profile)
+            profile.enable()
+
+        # From 3.12 cProfile is built on sys.monitoring, which is process-wide: the
+        # profiler below already sees every thread, and a second one cannot start.
+        if sys.version_info < (3, 12):
+            threading.setprofile(_profile_thread)
+        _active = self
+        self._started_at = datetime.now().isoformat(timespec="seconds")
+        self._started = time.perf_counter()
+
+        profile = cProfile.Profile()
+        self._profiles.append(profile)
+        profile.enable()
+
+    def stop(self) -> None:
+        """Stop profiling."""
+        global _active  # pylint: disable=global-statement
+        import tracemalloc
+
+        self._profiles[0].disable()
+        self._wall_seconds = time.perf_counter() - self._started
+        if sys.version_info < (3, 12):
+            threading.setprofile(None)  # type: ignore[arg-type]
+        _active = None
+
+        if tracemalloc.is_tracing():
+            self._take_peak_snapshot(force=self._snapshot is None)
+            self._peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    @contextlib.contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        """Time a block as a span nested under the thread's open spans.
+
+        Args:
+            name (str): Span name.
+        """
+        stack = self._local.__dict__.setdefault("stack", [])
+        stack.append([name, 0.0])
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            path = ";".join(frame[0] for frame in stack)
+            _, child_seconds = stack.pop()
+            if stack:
+                stack[-1][1] += elapsed
+
+            with self._lock:
+                stats = self._spans[path]
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] += elapsed - child_seconds
+                stats[3] = max(stats[3], elapsed)
+
+            if self.trace_memory:
+                self._take_peak_snapshot()
+
+    def write(self, output_dir: str, argv: list[str]) -> str:
+        """Write the artifacts of a stopped run.
+
+        Args:
+            output_dir (str): Parent directory of the run directory.
+            argv (list[str]): Command line of the target, recorded in the summary.
+
+        Returns:
+            str: The run directory.
+        """
+        import json
+        import pstats
+
+        run_dir = os.path.join(
+            output_dir, f"{self.label}-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        )
+        os.makedirs(run_dir, exist_ok=True)
+
+        stats = pstats.Stats(self._profiles[0])
+        for profile in self._profiles[1:]:
+            with contextlib.suppress(TypeError):  # threads that never ran any code
+                stats.add(profile)
+        stats.dump_stats(os.path.join(run_dir, "profile.pstats"))
+
+        with open(os.path.join(run_dir, "functions.collapsed"), "w") as file:
+            file.writelines(f"{stack} {micros}\n" for stack, micros in _collapse(stats))
+
+        with open(os.path.join(run_dir, "spans.collapsed"), "w") as file:
+            file.writelines(
+                f"{path} {round(values[2] * 1e6)}\n"
+                for path, values in sorted(self._spans.items())
+            )
+
+        with open(os.path.join(run_dir, "summary.json"), "w") as file:
+            json.dump(self._summary(stats, argv), file, indent=2)
+
+        return run_dir
+
+    def _take_peak_snapshot(self, force: bool = False) -> None:
+        import tracemalloc
+
+        if not tracemalloc.is_tracing():
+            return
+
+        peak = tracemalloc.get_traced_memory()[1]
+        if force or peak > self._snapshot_peak * PEAK_SNAPSHOT_GROWTH:
+            self._snapshot_peak = peak
+            self._snapshot = tracemalloc.take_snapshot().filter_traces(
+                [tracemalloc.Filter(False, tracemalloc.__file__)]
+            )
+
+    def _summary(self, stats: Any, argv: list[str]) -> dict[str, Any]:
+        categories: dict[str, float] = defaultdict(float)
+        for path, (_, _, self_seconds, _) in self._spans.items():
+            categories[path.rsplit(";", 1)[-1].split(":", 1)[0]] += self_seconds
+
+        functions = sorted(
+            stats.stats.items(), key=lambda item: item[1][3], reverse=True
+        )[:TOP_FUNCTIONS]
+
+        memory = None
+        if self.trace_memory:
+            memory = {
+                "peak_bytes": self._peak,
+                "top_allocations_at_peak": [
+                    {
+                        "location": f"{stat.traceback[0].filename}:"
+                        f"{stat.traceback[0].lineno}",
+                        "bytes": stat.size,
+                        "count": stat.count,
+                    }
+                    for stat in self._snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+                ],
+            }
+
+        return {
+            "label": self.label,
+            "argv": argv,
+            "python": sys.version.split()[0],
+            "started_at": self._started_at,
+            "wall_seconds": self._wall_seconds,
+            "threads": len(self._profiles),
+            "categories": dict(sorted(categories.items())),
+            "spans": {
+                path: {
+                    "count": int(count),
+                    "total_seconds": total,
+                    "self_seconds": self_seconds,
+                    "max_seconds": longest,
+                }
+                for path, (count, total, self_seconds, longest) in sorted(
+                    self._spans.items()
+                )
+            },
+            "functions": [
+                {
+                    "function": _function_name(function),
+                    "calls": calls,
+                    "self_seconds": self_seconds,
+                    "cumulative_seconds": cumulative,
+                }
+                for function, (_, calls, self_seconds, cumulative, _) in functions
+            ],
+            "memory": memory,
+        }
+
+
+def _function_name(function: tuple[str, int, str]) -> str:
+    filename, lineno, name = function
+    if filename == "~":
+        return name
+    return f"{os.path.basename(filename)}:{lineno}:{name}"
+
+
+def _collapse(stats: Any) -> list[tuple[str, int]]:
+    """Reconstruct approximate collapsed stacks from caller/callee edges.
+
+    cProfile only records one level of callers, so a function's time is split across
+    the paths leading to it in proportion to each caller's share of its cumulative
+    time. Recursion is cut at the first repeated function.
+    """
+    callees: dict[Any, list[tuple[Any, float]]] = defaultdict(list)
+    for function, (*_, callers) in stats.stats.items():
+        for caller, (*_, cumulative) in callers.items():
+            callees[caller].append((function, cumulative))
+
+    roots = [function for function, (*_, callers) in stats.stats.items() if not callers]
+    collapsed: dict[str, float] = defaultdict(float)
+
+    def _walk(function: Any, path: list[str], seen: set[Any], share: float) -> None:
+        _, _, self_seconds, cumulative, _ = stats.stats[function]
+        path = path + [_function_name(function)]
+        stack = ";".join(path)
+        collapsed[stack] += self_seconds * share
+
+        for callee, edge_cumulative in callees.get(function, []):
+            callee_cumulative = stats.stats[callee][3]
+            if callee in seen or not callee_cumulative:
+                continue
+            callee_share = share * min(edge_cumulative / callee_cumulative, 1.0)
+            if callee_cumulative * callee_share >= MIN_COLLAPSED_SECONDS:
+                _walk(callee, path, seen | {callee}, callee_share)
+
+    for root in roots:
+        _walk(root, [], {root}, 1.0)
+
+    return [
+        (stack, round(seconds * 1e6))
+        for stack, seconds in sorted(collapsed.items())
+        if round(seconds * 1e6)
+    ]
+
+
+def _parse_argument(value: str) -> Any:
+    import json
+
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def _target(arguments: list[str]) -> tuple[str, Callable[[], Any]]:
+    """Return a label and a runner for a script, `-m module` or `module:function`."""
+    import runpy
+
+    if arguments[0] == "-m":
+        module, rest = arguments[1], arguments[2:]
+
+        def _run_module() -> Any:
+            sys.argv = [module] + rest
+            return runpy.run_module(module, run_name="__main__", alter_sys=True)
+
+        return module.rsplit(".", 1)[-1], _run_module
+
+    target, rest = arguments[0], arguments[1:]
+    if target.endswith(".py"):
+        path = os.path.abspath(target)
+
+        def _run_path() -> Any:
+            sys.argv = [path] + rest
+            sys.path.insert(0, os.path.dirname(path))
+            return runpy.run_path(path, run_name="__main__")
+
+        return os.path.splitext(os.path.basename(path))[0], _run_path
+
+    module, _, name = target.partition(":")
+
+    def _run_function() -> Any:
+        import importlib
+
+        function = getattr(importlib.import_module(module), name)
+        return function(*map(_parse_argument, rest))
+
+    return name, _run_function
+
+
+def _compare(before_dir: str, after_dir: str, threshold: float) -> int:
+    import json
+
+    summaries = []
+    for run_dir in (before_dir, after_dir):
+        with open(os.path.join(run_dir, "summary.json"), encoding="utf-8") as file:
+            summaries.append(json.load(file))
+    before, after = summaries
+
+    rows = [("wall", before["wall_seconds"], after["wall_seconds"])]
+    rows += [
+        (f"category {name}", before["categories"].get(name, 0.0), seconds)
+        for name, seconds in after["categories"].items()
+    ]
+    rows += [
+        (
+            f"span {path}",
+            before["spans"].get(path, {}).get("total_seconds", 0.0),
+            values["total_seconds"],
+        )
+        for path, values in after["spans"].items()
+    ]
+    before_functions = {
+        function["function"]: function["cumulative_seconds"]
+        for function in before["functions"]
+    }
+    rows += [
+        (
+            f"function {function['function']}",
+            before_functions.get(function["function"], 0.0),
+            function["cumulative_seconds"],
+        )
+        for function in after["functions"][:15]
+    ]
+
+    regressions = 0
+    print(f"{'':60} {'before':>10} {'after':>10} {'change':>8}")
+    for name, old, new in rows:
+        change = (new - old) / old if old else float("inf")
+        flag = ""
+        if new - old > MIN_COLLAPSED_SECONDS and change > threshold:
+            flag = "  <-- regression"
+            regressions += 1
+        print(f"{name[:60]:60} {old:10.4f} {new:10.4f} {change:+8.1%}{flag}")
+
+    if before.get("memory") and after.get("memory"):
+        old, new = before["memory"]["peak_bytes"], after["memory"]["peak_bytes"]
+        print(f"{'peak memory (MiB)':60} {old / 2**20:10.2f} {new / 2**20:10.2f}")
+
+    return regressions
+
+
+def main() -> None:
+    """Profile a target or compare two runs from the command line."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="profile a script, -m module or module:func")
+    run.add_argument("--output-dir", default="profiles")
+    run.add_argument("--label", help="run name; defaults to the target's name")
+    run.add_argument(
+        "--no-memory", action="store_true", help="skip tracemalloc, which is slow"
+    )
+    run.add_argument("target", nargs=argparse.REMAINDER)
+
+    compare = commands.add_parser("compare", help="compare two run directories")
+    compare.add_argument("before")
+    compare.add_argument("after")
+    compare.add_argument(
+        "--threshold", type=float, default=0.2, help="relative slowdown to flag"
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        sys.exit(1 if _compare(args.before, args.after, args.threshold) else 0)
+
+    if not args.target:
+        parser.error("run needs a target")
+
+    label, runner = _target(args.target)
+    profiler = Profiler(args.label or label, trace_memory=not args.no_memory)
+    argv = list(args.target)
+
+    profiler.start()
+    try:
+        runner()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        profiler.stop()
+        print(f"Profile written to {profiler.write(args.output_dir, argv)}")
+
+
+if __name__ == "__main__":
+    # Targets import this module by name; make them share the launcher's profiler
+    sys.modules.setdefault("whoop_profiling", sys.modules[__name__])
+    main()
@@ -0,0 +1,255 @@
+"""Read-only query service over locally synced WHOOP data.
+
+Serves the sleep, cycle, recovery and workout files in `<WHOOP_DATA_DIR>` without
+going back to Airtable or the WHOOP API. The files are written by `whoop_backfill.py`
+and kept current by `run_whoop_sleep` and the webhook sync, which merge every change
+into them when `WHOOP_DATA_DIR` is set. Records are kept in memory sorted by local
+date, so a date range is two binary searches. Responses for the last 7, 30 and 90
+days are precomputed, both plain and gzipped, whenever a file changes.
+
+Endpoints:
+    GET /whoop/<collection>?start=YYYY-MM-DD&end=YYYY-MM-DD&fields=id,score.strain
+    GET /whoop/<collection>?last=30
+
+Responses carry an ETag and honour If-None-Match, and are gzipped when the client
+accepts it.
+
+Usage:
+    gunicorn -b :8080 whoop_read_service:app
+
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from typing import Any
+
+from flask import Flask, Response, request
+
+from whoop_time import to_local
+
+
+DATA_DIR = os.getenv("WHOOP_DATA_DIR") or "backfill"
+COLLECTIONS = ("sleep", "cycle", "recovery", "workout")
+HOT_RANGES = (7, 30, 90)
+RELOAD_CHECK_SECONDS = 5.0
+GZIP_MIN_BYTES = 1024
+
+app = Flask(__name__)
+
+
+def _project(record: dict[str, Any], fields: list[list[str]]) -> dict[str, Any]:
+    projected: dict[str, Any] = {}
+    for path in fields:
+        value: Any = record
+        for key in path:
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            target = projected
+            for key in path[:-1]:
+                target = target.setdefault(key, {})
+            target[path[-1]] = value
+    return projected
+
+
+class _Collection:
+    def __init__(self, records: list[dict[str, Any]], version: str):
+        self.records = records
+        self.dates = [record["local_date"] for record in records]
+        self.version = version
+        self.hot: dict[int, tuple[bytes, bytes]] = {}
+        self.hot_day: date | None = None
+
+    def range(self, start: str, end: str) -> list[dict[str, Any]]:
+        low = bisect_left(self.dates, start)
+        high = bisect_right(self.dates, end)
+        return self.records[low:high]
+
+    def refresh_hot(self) -> None:
+        today = date.today()
+        if self.hot_day == today:
+            return
+
+        # Built aside and swapped in whole, since requests on other threads read
+        # `hot` without the store's lock
+        hot = {}
+        for days in HOT_RANGES:
+            body = _encode(self.range(_days_ago(days), "9999"))
+            hot[days] = (body, gzip.compress(body))
+        self.hot = hot
+        self.hot_day = today
+
+
+class RecordStore:
+    """In-memory, date-indexed view of the synced WHOOP collections.
+
+    Files are re-read when their modification time changes, at most once every
+    `RELOAD_CHECK_SECONDS`.
+
+    Attributes:
+        data_dir (str): Directory holding `<collection>.json` files.
+    """
+
+    def __init__(self, data_dir: str = DATA_DIR):
+        """Initialize an empty store reading from `data_dir`.
+
+        Args:
+            data_dir (str): Directory holding `<collection>.json` files. Defaults to
+                `WHOOP_DATA_DIR` or "backfill".
+        """
+        self.data_dir = data_dir
+        self._collections: dict[str, _Collection] = {}
+        self._checked_at: dict[str, float] = {}
+        self._lock = threading.RLock()
+
+    def get(self, collection: str) -> _Collection:
+        """Return a collection, reloading it if its file changed.
+
+        Args:
+            collection (str): One of `COLLECTIONS`.
+
+        Returns:
+            _Collection: The loaded collection. Empty if the file does not exist.
+        """
+        now = time.monotonic()
+        if (
+            collection in self._collections
+            and now - self._checked_at.get(collection, 0) < RELOAD_CHECK_SECONDS
+        ):
+            loaded = self._collections[collection]
+            loaded.refresh_hot()
+            return loaded
+
+        with self._lock:
+            self._checked_at[collection] = now
+            path = os.path.join(self.data_dir, f"{collection}.json")
+            mtime = os.path.getmtime(path) if os.path.exists(path) else 0.0
+
+            # Recoveries take their local date from their cycle
+            cycles = self.get("cycle") if collection == "recovery" else None
+            version = f"{collection}-{mtime:.6f}"
+            if cycles:
+                version += f"+{cycles.version}"
+
+            loaded = self._collections.get(collection)
+            if loaded is None or loaded.version != version:
+                try:
+                    loaded = self._load(collection, path, version, cycles)
+                except ValueError as e:
+                    # Keep serving the previous version; retried on the next check
+                    app.logger.warning(f"Could not load {path}: {e}")
+                    loaded = loaded or _Collection([], "")
+                else:
+                    self._collections[collection] = loaded
+
+            loaded.refresh_hot()
+            return loaded
+
+    def _load(
+        self,
+        collection: str,
+        path: str,
+        version: str,
+        cycles: _Collection | None,
+    ) -> _Collection:
+        records: list[dict[str, Any]] = []
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                records = json.load(file)
+
+        cycle_dates = {}
+        if cycles:
+            cycle_dates = {
+                record["id"]: record["local_date"] for record in cycles.records
+            }
+
+        for record in records:
+            record["local_date"] = _local_date(collection, record, cycle_dates)
+        records.sort(key=lambda record: record["local_date"])
+
+        return _Collection(records, version)
+
+
+def _local_date(
+    collection: str, record: dict[str, Any], cycle_dates: dict[Any, str]
+) -> str:
+    if collection == "recovery":
+        if record.get("cycle_id") in cycle_dates:
+            return cycle_dates[record["cycle_id"]]
+        return record.get("created_at", "")[:10]
+
+    field = "end" if collection == "sleep" else "start"
+    return to_local(record[field], record["timezone_offset"]).date().isoformat()
+
+
+def _days_ago(days: int) -> str:
+    return (date.today() - timedelta(days=days - 1)).isoformat()
+
+
+def _encode(records: list[dict[str, Any]]) -> bytes:
+    return json.dumps(records, separators=(",", ":")).encode("utf-8")
+
+
+store = RecordStore()
+
+
+@app.route("/whoop/<collection>")
+def get_collection(collection: str):
+    """Serve a date range of one collection."""
+    if collection not in COLLECTIONS:
+        return {"error": f"Unknown collection: {collection}"}, 404
+
+    loaded = store.get(collection)
+    args = request.args
+    etag = hashlib.sha1(  # noqa: S324 - not used for security
+        f"{loaded.version}/{date.today()}?{sorted(args.items(multi=True))}".encode()
+    ).hexdigest()
+
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers={"ETag": f'"{etag}"'})
+
+    wants_gzip = "gzip" in request.headers.get("Accept-Encoding", "")
+    last = args.get("last", type=int)
+
+    if last in loaded.hot and not args.get("fields"):
+        body, gzipped = loaded.hot[last]
+    else:
+        if last:
+            start, end = _days_ago(last), "9999"
+        else:
+            start = args.get("start", "0000")
+            end = args.get("end", "9999")
+
+        records = loaded.range(start, end)
+        if fields := args.get("fields"):
+            paths = [field.split(".") for field in fields.split(",") if field]
+            records = [_project(record, paths) for record in records]
+
+        body = _encode(records)
+        gzipped = b""
+        if wants_gzip and len(body) >= GZIP_MIN_BYTES:
+            gzipped = gzip.compress(body)
+
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if wants_gzip and len(body) >= GZIP_MIN_BYTES:
+        body = gzipped
+        headers["Content-Encoding"] = "gzip"
+
+    return Response(body, mimetype="application/json", headers=headers)
+
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=8080)  # noqa: S104
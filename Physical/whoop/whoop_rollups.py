@@ -0,0 +1,499 @@
+"""Incrementally maintained daily, weekly and monthly rollups of WHOOP metrics.
+
+Dashboards that want weekly averages of sleep performance, REM/SWS totals, recovery
+score or cycle strain should not have to pull and aggregate the full history on every
+load. `RollupIndex` keeps one small JSON document with per-record metric values plus
+precomputed daily, weekly, monthly and rolling 7/30-day aggregates. When new records
+are synced, only the periods that those records touch are recomputed.
+
+Records are keyed by their local date, derived from `timezone_offset` in the same way
+as the rest of the sync code.
+
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from datetime import date, timedelta
+from typing import Any, Callable, Iterable
+
+from whoop_sleep import convert_millis_to_duration
+from whoop_time import to_local
+
+
+ROLLING_WINDOWS = (7, 30)
+
+SLEEP_METRICS: dict[str, Callable[[dict[str, Any]], float | None]] = {
+    "sleep_performance_percentage": lambda score: score.get(
+        "sleep_performance_percentage"
+    ),
+    "total_in_bed_time": lambda score: convert_millis_to_duration(
+        score["stage_summary"]["total_in_bed_time_milli"]
+    ),
+    "total_rem_sleep_time": lambda score: convert_millis_to_duration(
+        score["stage_summary"]["total_rem_sleep_time_milli"]
+    ),
+    "total_slow_wave_sleep_time": lambda score: convert_millis_to_duration(
+        score["stage_summary"]["total_slow_wave_sleep_time_milli"]
+    ),
+}
+
+CYCLE_METRICS: dict[str, Callable[[dict[str, Any]], float | None]] = {
+    "strain": lambda score: score.get("strain"),
+    "kilojoule": lambda score: score.get("kilojoule"),
+}
+
+RECOVERY_METRICS: dict[str, Callable[[dict[str, Any]], float | None]] = {
+    "recovery_score": lambda score: score.get("recovery_score"),
+    "resting_heart_rate": lambda score: score.get("resting_heart_rate"),
+    "hrv_rmssd_milli": lambda score: score.get("hrv_rmssd_milli"),
+}
+
+
+def local_date(dt_str: str, offset_str: str) -> str:
+    """Return the local calendar date of a WHOOP timestamp.
+
+    Args:
+        dt_str (str): UTC timestamp as returned by the WHOOP API.
+        offset_str (str): The record's `timezone_offset`, e.g. "-05:00".
+
+    Returns:
+        str: Local date in ISO 8601 format (YYYY-MM-DD).
+    """
+    return to_local(dt_str, offset_str).date().isoformat()
+
+
+def _scored_metrics(
+    record: dict[str, Any],
+    extractors: dict[str, Callable[[dict[str, Any]], float | None]],
+) -> dict[str, float]:
+    score = record.get("score") or {}
+    if record.get("score_state", "SCORED") != "SCORED" or not score:
+        return {}
+
+    metrics = {}
+    for name, extract in extractors.items():
+        try:
+            value = extract(score)
+        except (KeyError, TypeError):
+            value = None
+        if value is not None:
+            metrics[name] = float(value)
+
+    return metrics
+
+
+def _combine(stats: Iterable[dict[str, float]]) -> dict[str, float] | None:
+    total = 0.0
+    count = 0
+    low = float("inf")
+    high = float("-inf")
+
+    for stat in stats:
+        total += stat["sum"]
+        count += int(stat["count"])
+        low = min(low, stat["min"])
+        high = max(high, stat["max"])
+
+    if not count:
+        return None
+
+    return {
+        "sum": total,
+        "count": count,
+        "min": low,
+        "max": high,
+        "mean": total / count,
+    }
+
+
+def _week_key(day: date) -> str:
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def _month_key(day: date) -> str:
+    return f"{day.year}-{day.month:02d}"
+
+
+def _days_of_month(month_start: date) -> Iterable[date]:
+    day = month_start
+    while day.month == month_start.month:
+        yield day
+        day += timedelta(days=1)
+
+
+class RollupIndex:
+    """Precomputed rollups of WHOOP sleep, recovery and cycle metrics.
+
+    Attributes:
+        path (str | None): JSON file the index is persisted to. If `None`, the index
+            only lives in memory.
+        records (dict[str, dict[str, Any]]): Local date and metric values for every
+            ingested record, keyed by "<collection>:<record id>".
+        daily (dict[str, dict[str, dict[str, float]]]): Per-metric statistics keyed by
+            local date (YYYY-MM-DD).
+        weekly (dict[str, dict[str, dict[str, float]]]): Per-metric statistics keyed
+            by ISO week (YYYY-Www).
+        monthly (dict[str, dict[str, dict[str, float]]]): Per-metric statistics keyed
+            by month (YYYY-MM).
+        rolling (dict[str, dict[str, dict[str, dict[str, float]]]]): Trailing window
+            statistics keyed by window length in days and then by the local date the
+            window ends on.
+    """
+
+    def __init__(self, path: str | None = None):
+        """Initialize an index, loading existing rollups from `path` if present.
+
+        Args:
+            path (str, optional): JSON file to load from and save to.
+        """
+        self.path = path
+        self.records: dict[str, dict[str, Any]] = {}
+        self.daily: dict[str, dict[str, dict[str, float]]] = {}
+        self.weekly: dict[str, dict[str, dict[str, float]]] = {}
+        self.monthly: dict[str, dict[str, dict[str, float]]] = {}
+        self.rolling: dict[str, dict[str, dict[str, dict[str, float]]]] = {
+            str(window): {} for window in ROLLING_WINDOWS
+        }
+        self._by_date: dict[str, set[str]] = {}
+
+        if path and os.path.exists(path):
+            self._load(path)
+
+    ####################################################################################
+    # INGESTION
+
+    def add_sleeps(self, records: Iterable[dict[str, Any]]) -> set[str]:
+        """Ingest sleep records, keyed by the local date the sleep ended on.
+
+        Args:
+            records (Iterable[dict[str, Any]]): Records from `get_sleep_collection()`.
+
+        Returns:
+            set[str]: Local dates whose rollups were recomputed.
+        """
+        return self._add(
+            "sleep",
+            (
+                (
+                    record["id"],
+                    local_date(record["end"], record["timezone_offset"]),
+                    _scored_metrics(record, SLEEP_METRICS),
+                )
+                for record in records
+            ),
+        )
+
+    def add_cycles(self, records: Iterable[dict[str, Any]]) -> set[str]:
+        """Ingest physiological cycles, keyed by the local date the cycle started on.
+
+        Args:
+            records (Iterable[dict[str, Any]]): Records from `get_cycle_collection()`.
+
+        Returns:
+            set[str]: Local dates whose rollups were recomputed.
+        """
+        return self._add(
+            "cycle",
+            (
+                (
+                    record["id"],
+                    local_date(record["start"], record["timezone_offset"]),
+                    _scored_metrics(record, CYCLE_METRICS),
+                )
+                for record in records
+            ),
+        )
+
+    def add_recoveries(
+        self,
+        records: Iterable[dict[str, Any]],
+        cycles: Iterable[dict[str, Any]] = (),
+    ) -> set[str]:
+        """Ingest recoveries, keyed by the local start date of their cycle.
+
+        Recoveries carry no `timezone_offset` of their own. When the matching cycle is
+        passed in (or was ingested earlier) its local date is used; otherwise the UTC
+        date of `created_at` is used.
+
+        Args:
+            records (Iterable[dict[str, Any]]): Recovery records.
+            cycles (Iterable[dict[str, Any]], optional): Cycles used to resolve the
+                local date of each recovery.
+
+        Returns:
+            set[str]: Local dates whose rollups were recomputed.
+        """
+        cycle_dates = {
+            str(cycle["id"]): local_date(cycle["start"], cycle["timezone_offset"])
+            for cycle in cycles
+        }
+
+        def _date(record: dict[str, Any]) -> str:
+            cycle_id = str(record["cycle_id"])
+            known = self.records.get(f"cycle:{cycle_id}")
+            if cycle_id in cycle_dates:
+                return cycle_dates[cycle_id]
+            if known:
+                return known["date"]
+            return local_date(record["created_at"], "+00:00")
+
+        return self._add(
+            "recovery",
+            (
+                (
+                    record["cycle_id"],
+                    _date(record),
+                    _scored_metrics(record, RECOVERY_METRICS),
+                )
+                for record in records
+            ),
+        )
+
+    def remove(self, collection: str, record_ids: Iterable[Any]) -> set[str]:
+        """Drop deleted records and recompute the rollups of their dates.
+
+        Args:
+            collection (str): "sleep", "cycle" or "recovery".
+            record_ids (Iterable[Any]): IDs of the deleted records. Recoveries are
+                identified by their `cycle_id`.
+
+        Returns:
+            set[str]: Local dates whose rollups were recomputed.
+        """
+        touched: set[str] = set()
+
+        for record_id in record_ids:
+            key = f"{collection}:{record_id}"
+            if previous := self.records.pop(key, None):
+                self._by_date[previous["date"]].discard(key)
+                touched.add(previous["date"])
+
+        self._recompute(touched)
+
+        return touched
+
+    def _add(
+        self, collection: str, rows: Iterable[tuple[Any, str, dict[str, float]]]
+    ) -> set[str]:
+        touched: set[str] = set()
+
+        for record_id, day, metrics in rows:
+            key = f"{collection}:{record_id}"
+
+            if previous := self.records.get(key):
+                if previous == {"date": day, "metrics": metrics}:
+                    continue
+                self._by_date[previous["date"]].discard(key)
+                touched.add(previous["date"])
+
+            self.records[key] = {"date": day, "metrics": metrics}
+            self._by_date.setdefault(day, set()).add(key)
+            touched.add(day)
+
+        self._recompute(touched)
+
+        return touched
+
+    ####################################################################################
+    # QUERIES
+
+    def get_daily(self, start_date: str, end_date: str) -> dict[str, Any]:
+        """Return daily rollups between two local dates (inclusive).
+
+        Args:
+            start_date (str): First local date (YYYY-MM-DD).
+            end_date (str): Last local date (YYYY-MM-DD).
+
+        Returns:
+            dict[str, Any]: Daily statistics keyed by local date.
+        """
+        return {
+            day: stats
+            for day, stats in sorted(self.daily.items())
+            if start_date <= day <= end_date
+        }
+
+    def get_rolling(self, window: int, day: str) -> dict[str, dict[str, float]]:
+        """Return trailing window statistics ending on a local date.
+
+        Args:
+            window (int): Window length in days. One of `ROLLING_WINDOWS`.
+            day (str): Last local date of the window (YYYY-MM-DD).
+
+        Returns:
+            dict[str, dict[str, float]]: Per-metric statistics, empty if no data.
+        """
+        return self.rolling[str(window)].get(day, {})
+
+    ####################################################################################
+    # PERSISTENCE
+
+    def save(self, path: str | None = None) -> None:
+        """Write the index to disk.
+
+        Args:
+            path (str, optional): Destination file. Defaults to `self.path`.
+
+        Raises:
+            ValueError: If neither `path` nor `self.path` is set.
+        """
+        path = path or self.path
+        if not path:
+            raise ValueError("No path given to save the rollup index to")
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "records": self.records,
+                    "daily": self.daily,
+                    "weekly": self.weekly,
+                    "monthly": self.monthly,
+                    "rolling": self.rolling,
+                },
+                file,
+            )
+        os.replace(tmp_path, path)
+
+    def _load(self, path: str) -> None:
+        with open(path, encoding="utf-8") as file:
+            data = json.load(file)
+
+        self.records = data["records"]
+        self.daily = data["daily"]
+        self.weekly = data["weekly"]
+        self.monthly = data["monthly"]
+        self.rolling.update(data["rolling"])
+
+        for key, record in self.records.items():
+            self._by_date.setdefault(record["date"], set()).add(key)
+
+    ####################################################################################
+    # ROLLUP HELPERS
+
+    def _recompute(self, touched: set[str]) -> None:
+        if not touched:
+            return
+
+        days = sorted(date.fromisoformat(day) for day in touched)
+
+        for day in days:
+            self._recompute_day(day.isoformat())
+
+        for week_start in {day - timedelta(days=day.weekday()) for day in days}:
+            self._set_period(
+                self.weekly,
+                _week_key(week_start),
+                (week_start + timedelta(days=offset) for offset in range(7)),
+            )
+
+        for month_start in {day.replace(day=1) for day in days}:
+            self._set_period(
+                self.monthly,
+                _month_key(month_start),
+                _days_of_month(month_start),
+            )
+
+        for window in ROLLING_WINDOWS:
+            self._recompute_rolling(window, days)
+
+    def _recompute_day(self, day: str) -> None:
+        values: dict[str, list[float]] = {}
+        for key in self._by_date.get(day, ()):
+            for metric, value in self.records[key]["metrics"].items():
+                values.setdefault(metric, []).append(value)
+
+        if not values:
+            self.daily.pop(day, None)
+            return
+
+        self.daily[day] = {
+            metric: {
+                "sum": sum(vals),
+                "count": len(vals),
+                "min": min(vals),
+                "max": max(vals),
+                "mean": sum(vals) / len(vals),
+            }
+            for metric, vals in values.items()
+        }
+
+    def _set_period(
+        self,
+        target: dict[str, dict[str, dict[str, float]]],
+        key: str,
+        days: Iterable[date],
+    ) -> None:
+        if stats := self._combine_days(day.isoformat() for day in days):
+            target[key] = stats
+        else:
+            target.pop(key, None)
+
+    def _recompute_rolling(self, window: int, days: list[date]) -> None:
+        rolling = self.rolling[str(window)]
+        ends: set[date] = set()
+        for day in days:
+            ends.update(day + timedelta(days=offset) for offset in range(window))
+
+        for end in ends:
+            stats = self._combine_days(
+                (end - timedelta(days=offset)).isoformat() for offset in range(window)
+            )
+            if stats:
+                rolling[end.isoformat()] = stats
+            else:
+                rolling.pop(end.isoformat(), None)
+
+    def _combine_days(self, days: Iterable[str]) -> dict[str, dict[str, float]]:
+        per_metric: dict[str, list[dict[str, float]]] = {}
+        for day in days:
+            for metric, stat in self.daily.get(day, {}).items():
+                per_metric.setdefault(metric, []).append(stat)
+
+        combined = {}
+        for metric, stats in per_metric.items():
+            if result := _combine(stats):
+                combined[metric] = result
+
+        return combined
+
+
+def update_rollups(
+    path: str,
+    sleeps: Iterable[dict[str, Any]] = (),
+    cycles: Iterable[dict[str, Any]] = (),
+    recoveries: Iterable[dict[str, Any]] = (),
+    deleted: dict[str, Iterable[Any]] | None = None,
+) -> set[str]:
+    """Fold newly synced records into the rollup index stored at `path`.
+
+    Args:
+        path (str): JSON file holding the rollup index.
+        sleeps (Iterable[dict[str, Any]], optional): New sleep records.
+        cycles (Iterable[dict[str, Any]], optional): New cycle records.
+        recoveries (Iterable[dict[str, Any]], optional): New recovery records.
+        deleted (dict[str, Iterable[Any]], optional): IDs of deleted records per
+            collection ("sleep", "cycle" or "recovery").
+
+    Returns:
+        set[str]: Local dates whose rollups were recomputed.
+    """
+    cycles = list(cycles)
+    index = RollupIndex(path)
+
+    touched = set()
+    for collection, record_ids in (deleted or {}).items():
+        touched |= index.remove(collection, record_ids)
+
+    touched |= index.add_sleeps(sleeps)
+    touched |= index.add_cycles(cycles)
+    touched |= index.add_recoveries(recoveries, cycles)
+
+    index.save()
+
+    print(f"Rollups updated for {len(touched)} day(s) in {path}")
+
+    return touched
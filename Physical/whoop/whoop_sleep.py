@@ -2,24 +2,45 @@ from __future__ import annotations
 
 import os
 import json
+import time as clock
 from datetime import datetime, timedelta, time
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-from authlib.common.urls import extract_params
-from authlib.integrations.requests_client import OAuth2Session
-from pyairtable import Table
+from whoop_profiling import span
+from whoop_time import localize_records
+
+# authlib, pyairtable and requests dominate the cold start of run_whoop_sleep, so
+# they are only imported once a client or table is actually built.
+if TYPE_CHECKING:
+    from pyairtable import Table
+
+    from whoop_archive import PageArchive
 
 username = os.getenv("USERNAME") or ""
 password = os.getenv("PASSWORD") or ""
 AIRTABLE_API_KEY = os.getenv("AIRTABLE_API_KEY")
 BASE_ID = os.getenv("AIRTABLE_BASE_ID")
 TABLE_NAME = os.getenv("AIRTABLE_TABLE_NAME")
+ROLLUP_INDEX_PATH = os.getenv("ROLLUP_INDEX_PATH")
+CHART_SNAPSHOT_DESTINATION = os.getenv("CHART_SNAPSHOT_DESTINATION")
+# The chart's Date/Activity/Elapsed Time table, not the sleep table
+CHART_TABLE_NAME = os.getenv("CHART_TABLE_NAME")
+WHOOP_ARCHIVE_DIR = os.getenv("WHOOP_ARCHIVE_DIR")
+ANOMALY_STATE_PATH = os.getenv("ANOMALY_STATE_PATH")
+WHOOP_DATA_DIR = os.getenv("WHOOP_DATA_DIR")
 
 AUTH_URL = "https://api-7.whoop.com"
 REQUEST_URL = "https://api.prod.whoop.com/developer"
+TOKEN_EXPIRY_MARGIN_SECONDS = 60
+
+# Reused across warm invocations of run_whoop_sleep
+_client: WhoopClient | None = None
+_tables: dict[str, Table] = {}
 
 
 def _auth_password_json(_client, _method, uri, headers, body):
+    from authlib.common.urls import extract_params
+
     body = json.dumps(dict(extract_params(body)))
     headers["Content-Type"] = "application/json"
     return uri, headers, body
@@ -32,6 +53,8 @@ class WhoopClient:
         self._username = username
         self._password = password
 
+        from authlib.integrations.requests_client import OAuth2Session
+
         self.session = OAuth2Session(
             token_endpoint=f"{AUTH_URL}/oauth/token",
             token_endpoint_auth_method=self.TOKEN_ENDPOINT_AUTH_METHOD,
@@ -42,6 +65,7 @@ class WhoopClient:
         )
 
         self.user_id = ""
+        self.archive: PageArchive | None = None
 
         if authenticate:
             self.authenticate()
@@ -66,6 +90,39 @@ class WhoopClient:
             params={"start": start, "end": end, "limit": 25},
         )
 
+    def get_sleep_by_id(self, sleep_id: str) -> dict[str, Any]:
+        return self._make_request(method="GET", url_slug=f"v1/activity/sleep/{sleep_id}")
+
+    def get_cycle_by_id(self, cycle_id: str) -> dict[str, Any]:
+        return self._make_request(method="GET", url_slug=f"v1/cycle/{cycle_id}")
+
+    def get_workout_by_id(self, workout_id: str) -> dict[str, Any]:
+        return self._make_request(method="GET", url_slug=f"v1/activity/workout/{workout_id}")
+
+    def get_cycle_collection(self, start_date: str | None = None, end_date: str | None = None) -> list[dict[str, Any]]:
+        start, end = self._format_dates(start_date, end_date)
+        return self._make_paginated_request(
+            method="GET",
+            url_slug="v1/cycle",
+            params={"start": start, "end": end, "limit": 25},
+        )
+
+    def get_recovery_collection(self, start_date: str | None = None, end_date: str | None = None) -> list[dict[str, Any]]:
+        start, end = self._format_dates(start_date, end_date)
+        return self._make_paginated_request(
+            method="GET",
+            url_slug="v1/recovery",
+            params={"start": start, "end": end, "limit": 25},
+        )
+
+    def get_workout_collection(self, start_date: str | None = None, end_date: str | None = None) -> list[dict[str, Any]]:
+        start, end = self._format_dates(start_date, end_date)
+        return self._make_paginated_request(
+            method="GET",
+            url_slug="v1/activity/workout",
+            params={"start": start, "end": end, "limit": 25},
+        )
+
     def authenticate(self, **kwargs) -> None:
         self.session.fetch_token(
             url=f"{AUTH_URL}/oauth/token",
@@ -81,6 +138,13 @@ class WhoopClient:
     def is_authenticated(self) -> bool:
         return self.session.token is not None
 
+    def token_expires_soon(self) -> bool:
+        token = self.session.token or {}
+        expires_at = token.get("expires_at")
+        if not expires_at:
+            return False
+        return expires_at < clock.time() + TOKEN_EXPIRY_MARGIN_SECONDS
+
     def _make_paginated_request(self, method, url_slug, **kwargs) -> list[dict[str, Any]]:
         params = kwargs.pop("params", {})
         response_data: list[dict[str, Any]] = []
@@ -103,15 +167,23 @@ class WhoopClient:
         return response_data
 
     def _make_request(self, method: str, url_slug: str, **kwargs: Any) -> dict[str, Any]:
-        response = self.session.request(
-            method=method,
-            url=f"{REQUEST_URL}/{url_slug}",
-            **kwargs,
-        )
+        with span("network"):
+            response = self.session.request(
+                method=method,
+                url=f"{REQUEST_URL}/{url_slug}",
+                **kwargs,
+            )
 
         response.raise_for_status()
 
-        return response.json()
+        with span("json_decode"):
+            data = response.json()
+
+        if self.archive is not None:
+            with span("sink:archive"):
+                self.archive.append(url_slug, kwargs.get("params"), data)
+
+        return data
 
     def _format_dates(self, start_date: str | None, end_date: str | None) -> tuple[str, str]:
         end = datetime.combine(
@@ -135,15 +207,128 @@ class WhoopClient:
         )
 
 
+def convert_millis_to_duration(millis):
+    return millis // 1000
+
+
+def extract_sleep_data(sleep_data: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Flatten raw sleep records into the rows written to Airtable.
+
+    Sleeps without a score (PENDING_SCORE or UNSCORABLE) are skipped.
+    """
+    sleep_data = [record for record in sleep_data if record.get("score")]
+    local_starts = localize_records(sleep_data, "start")
+    local_ends = localize_records(sleep_data, "end")
+
+    return [
+        {
+            "ID": record["id"],
+            "timezone_offset": record["timezone_offset"],
+            "timezone_adjusted_start": local_start.isoformat(),
+            "timezone_adjusted_end": local_end.isoformat(),
+            "total_in_bed_time": convert_millis_to_duration(record["score"]["stage_summary"]["total_in_bed_time_milli"]),
+            "total_slow_wave_sleep_time": convert_millis_to_duration(record["score"]["stage_summary"]["total_slow_wave_sleep_time_milli"]),
+            "total_rem_sleep_time": convert_millis_to_duration(record["score"]["stage_summary"]["total_rem_sleep_time_milli"]),
+            "sleep_performance_percentage": record["score"]["sleep_performance_percentage"],
+            "need_from_sleep_debt": convert_millis_to_duration(record["score"]["sleep_needed"]["need_from_sleep_debt_milli"])
+        }
+        for record, local_start, local_end in zip(sleep_data, local_starts, local_ends)
+    ]
+
+
 def check_existing_records(table: Table, record_id: str) -> bool:
     """Check if a record already exists in the Airtable table."""
     existing_records = table.all(formula=f"{{ID}} = '{record_id}'")
     return len(existing_records) > 0
 
 
+def get_client() -> WhoopClient:
+    """Return the module's WHOOP client, re-authenticating only when needed."""
+    global _client  # pylint: disable=global-statement
+
+    if _client is None:
+        _client = WhoopClient(username, password, authenticate=False)
+        if WHOOP_ARCHIVE_DIR:
+            from whoop_archive import PageArchive
+
+            _client.archive = PageArchive(WHOOP_ARCHIVE_DIR)
+        _client.authenticate()
+    elif not _client.is_authenticated() or _client.token_expires_soon():
+        _client.authenticate()
+
+    return _client
+
+
+def get_table(table_name: str | None = TABLE_NAME) -> Table:
+    """Return a cached Airtable table."""
+    if table_name not in _tables:
+        from pyairtable import Table
+
+        _tables[table_name] = Table(AIRTABLE_API_KEY, BASE_ID, table_name)
+
+    return _tables[table_name]
+
+
+def upload_sleep_data(
+    sleep_data: list[dict[str, Any]],
+    cycle_data: list[dict[str, Any]] | None = None,
+    recovery_data: list[dict[str, Any]] | None = None,
+) -> None:
+    """Push raw records to the local store and the rollups, and sleeps to Airtable."""
+    if WHOOP_DATA_DIR:
+        from whoop_backfill import update_collection  # whoop_backfill imports this module
+
+        with span("sink:local_store"):
+            update_collection(WHOOP_DATA_DIR, "sleep", sleep_data)
+            if cycle_data:
+                update_collection(WHOOP_DATA_DIR, "cycle", cycle_data)
+            if recovery_data:
+                update_collection(WHOOP_DATA_DIR, "recovery", recovery_data)
+
+    if ROLLUP_INDEX_PATH:
+        from whoop_rollups import update_rollups  # whoop_rollups imports this module
+
+        with span("sink:rollups"):
+            update_rollups(
+                ROLLUP_INDEX_PATH,
+                sleeps=sleep_data,
+                cycles=cycle_data or [],
+                recoveries=recovery_data or [],
+            )
+
+    with span("transform"):
+        extracted_sleep_data = extract_sleep_data(sleep_data)
+
+    table = get_table()
+
+    with span("sink:airtable"):
+        for record in extracted_sleep_data:
+            if not check_existing_records(table, record["ID"]):  # Only add if the record doesn't exist
+                try:
+                    response = table.create(record)
+                    print(f"Record created: {response}")
+                except Exception as e:
+                    print(f"Error creating record: {e}")
+            else:
+                print(f"Record already exists: {record['ID']}")
+
+
+def detect_anomalies(sleep_data: list[dict[str, Any]], recovery_data: list[dict[str, Any]]) -> None:
+    """Score new sleep and recovery records against the persisted per-user baselines."""
+    from whoop_anomaly import AnomalyDetector, print_anomalies
+
+    sink = AnomalyDetector(ANOMALY_STATE_PATH).as_sink([print_anomalies])
+    with span("sink:anomaly"):
+        sink("recovery", recovery_data, [])
+        sink("sleep", sleep_data, [])
+
+
 def run_whoop_sleep(event, context):
     print(f"Starting function with username: {username}, AIRTABLE_API_KEY: {AIRTABLE_API_KEY}")
-    client = WhoopClient(username, password)
+    if CHART_SNAPSHOT_DESTINATION and not CHART_TABLE_NAME:
+        raise ValueError("CHART_TABLE_NAME must be set when CHART_SNAPSHOT_DESTINATION is")
+
+    client = get_client()
 
     today = datetime.today().date()
     last_fetched = today - timedelta(days=3)  # Fetch last 3 days to ensure no missed data
@@ -153,43 +338,24 @@ def run_whoop_sleep(event, context):
 
     sleep_data = client.get_sleep_collection(last_fetched_iso, today_iso)
 
-    def adjust_timezone(dt_str, offset_str):
-        dt = datetime.fromisoformat(dt_str.replace("Z", "+00:00"))
-        hours, minutes = map(int, offset_str.split(":"))
-        if "+" in offset_str:
-            adjusted_dt = dt - timedelta(hours=hours, minutes=minutes)
-        else:
-            adjusted_dt = dt + timedelta(hours=hours, minutes=minutes)
-        return adjusted_dt.isoformat()
+    # Cycles and recoveries feed the strain and recovery rollups, the local store and
+    # anomaly detection, so they are only fetched when one of those is enabled
+    cycle_data = []
+    recovery_data = []
+    if ROLLUP_INDEX_PATH or WHOOP_DATA_DIR:
+        cycle_data = client.get_cycle_collection(last_fetched_iso, today_iso)
+    if ROLLUP_INDEX_PATH or WHOOP_DATA_DIR or ANOMALY_STATE_PATH:
+        recovery_data = client.get_recovery_collection(last_fetched_iso, today_iso)
 
-    def convert_millis_to_duration(millis):
-        return millis // 1000
+    upload_sleep_data(sleep_data, cycle_data, recovery_data)
 
-    extracted_sleep_data = [
-        {
-            "ID": record["id"],
-            "timezone_offset": record["timezone_offset"],
-            "timezone_adjusted_start": adjust_timezone(record["start"], record["timezone_offset"]),
-            "timezone_adjusted_end": adjust_timezone(record["end"], record["timezone_offset"]),
-            "total_in_bed_time": convert_millis_to_duration(record["score"]["stage_summary"]["total_in_bed_time_milli"]),
-            "total_slow_wave_sleep_time": convert_millis_to_duration(record["score"]["stage_summary"]["total_slow_wave_sleep_time_milli"]),
-            "total_rem_sleep_time": convert_millis_to_duration(record["score"]["stage_summary"]["total_rem_sleep_time_milli"]),
-            "sleep_performance_percentage": record["score"]["sleep_performance_percentage"],
-            "need_from_sleep_debt": convert_millis_to_duration(record["score"]["sleep_needed"]["need_from_sleep_debt_milli"])
-        }
-        for record in sleep_data
-    ]
+    print("Data uploaded successfully!")
 
-    table = Table(AIRTABLE_API_KEY, BASE_ID, TABLE_NAME)
+    if ANOMALY_STATE_PATH:
+        detect_anomalies(sleep_data, recovery_data)
 
-    for record in extracted_sleep_data:
-        if not check_existing_records(table, record["ID"]):  # Only add if the record doesn't exist
-            try:
-                response = table.create(record)
-                print(f"Record created: {response}")
-            except Exception as e:
-                print(f"Error creating record: {e}")
-        else:
-            print(f"Record already exists: {record['ID']}")
+    if CHART_SNAPSHOT_DESTINATION:
+        from whoop_snapshot import publish_chart_snapshot
 
-    print("Data uploaded successfully!")
+        with span("sink:chart_snapshot"):
+            publish_chart_snapshot(get_table(CHART_TABLE_NAME), CHART_SNAPSHOT_DESTINATION)
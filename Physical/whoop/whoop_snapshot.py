@@ -0,0 +1,135 @@
+"""Publish a precomputed snapshot of the airtable-chart series after each sync.
+
+The `airtable-chart` dashboard used to query Airtable on every page load and only read
+the first page of 100 records. Since `run_whoop_sleep` is the job that writes to
+Airtable, it can instead read the full table once per sync and publish a compact,
+columnar JSON snapshot that the chart's API route serves with cache headers.
+
+The snapshot format is:
+    {
+        "version": 1,
+        "generated_at": "2024-01-01T12:00:00+00:00",
+        "count": 2,
+        "date": ["2023-12-31", "2024-01-01"],
+        "activity": ["Sleep", "Sleep"],
+        "elapsedTime": [28800, 27000]
+    }
+
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import os
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any
+
+import requests
+
+
+if TYPE_CHECKING:
+    from pyairtable import Table
+
+
+SNAPSHOT_VERSION = 1
+
+# Airtable field read for each snapshot column. Matches the fields read by
+# airtable-chart/app/api/airtable-data/route.ts.
+CHART_FIELDS = {
+    "date": "Date",
+    "activity": "Activity",
+    "elapsedTime": "Elapsed Time",
+}
+
+CHART_DEFAULTS: dict[str, Any] = {
+    "date": "No Date",
+    "activity": "No Activity",
+    "elapsedTime": 0,
+}
+
+
+def build_chart_snapshot(
+    records: list[dict[str, Any]], fields: dict[str, str] | None = None
+) -> dict[str, Any]:
+    """Build a columnar chart snapshot from Airtable records.
+
+    Args:
+        records (list[dict[str, Any]]): Records as returned by `Table.all()`.
+        fields (dict[str, str], optional): Airtable field name for each snapshot
+            column. Defaults to `CHART_FIELDS`.
+
+    Returns:
+        dict[str, Any]: Snapshot with one list per column, sorted by date.
+    """
+    fields = fields or CHART_FIELDS
+    rows = sorted(
+        (
+            {
+                column: record["fields"].get(field, CHART_DEFAULTS.get(column))
+                for column, field in fields.items()
+            }
+            for record in records
+        ),
+        key=lambda row: str(row.get("date", "")),
+    )
+
+    snapshot: dict[str, Any] = {
+        "version": SNAPSHOT_VERSION,
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "count": len(rows),
+    }
+    for column in fields:
+        snapshot[column] = [row[column] for row in rows]
+
+    return snapshot
+
+
+def publish_snapshot(snapshot: dict[str, Any], destination: str) -> None:
+    """Write a snapshot to a local file or upload it to a URL.
+
+    HTTP(S) destinations receive a gzipped PUT, which works with pre-signed object
+    storage URLs. Anything else is treated as a local path.
+
+    Args:
+        snapshot (dict[str, Any]): Snapshot from `build_chart_snapshot()`.
+        destination (str): Local path or HTTP(S) URL.
+    """
+    body = json.dumps(snapshot, separators=(",", ":")).encode("utf-8")
+
+    if destination.startswith(("http://", "https://")):
+        response = requests.put(
+            destination,
+            data=gzip.compress(body),
+            headers={
+                "Content-Type": "application/json",
+                "Content-Encoding": "gzip",
+                "Cache-Control": "public, max-age=300",
+            },
+            timeout=30,
+        )
+        response.raise_for_status()
+    else:
+        tmp_path = f"{destination}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(body)
+        os.replace(tmp_path, destination)
+
+    print(f"Published chart snapshot with {snapshot['count']} records to {destination}")
+
+
+def publish_chart_snapshot(table: Table, destination: str) -> dict[str, Any]:
+    """Read the full chart table once and publish it as a snapshot.
+
+    Args:
+        table (Table): Airtable table backing the chart.
+        destination (str): Local path or HTTP(S) URL for the snapshot.
+
+    Returns:
+        dict[str, Any]: The published snapshot.
+    """
+    records = table.all(fields=list(CHART_FIELDS.values()))
+    snapshot = build_chart_snapshot(records)
+    publish_snapshot(snapshot, destination)
+
+    return snapshot
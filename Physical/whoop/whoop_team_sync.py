@@ -0,0 +1,310 @@
+"""Sync WHOOP sleep data for a whole team of accounts in parallel.
+
+`run_whoop_sleep` syncs a single account taken from the environment. This module
+takes a roster of accounts instead and shards them across a process pool, so one slow
+account never holds up the rest of the team. Every worker:
+
+- reuses a cached OAuth token for its account when one is still valid,
+- draws from a request budget shared by all workers so the team as a whole stays
+  under the API rate limit, and
+- merges its raw sleep records into its own partition of the output directory, a
+  `sleep.json` in the format `whoop_backfill.py` writes, so history accumulates
+  across runs.
+
+A JSON summary with per-account duration, record count and error is written next to
+the partitions.
+
+Usage:
+    python whoop_team_sync.py roster.json --output-dir team_data --workers 4
+
+The roster is a JSON list of accounts:
+    [
+        {"name": "alice", "username": "alice@example.com", "password_env": "ALICE_PW"},
+        {"name": "bob", "username": "bob@example.com", "password": "..."}
+    ]
+
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Any
+
+from whoop_backfill import update_collection
+from whoop_sleep import WhoopClient
+
+
+# Account names become directory names, so they may not contain separators or
+# start with a dot (which would also clash with the ".tokens" directory)
+_ACCOUNT_NAME = re.compile(r"[\w@+-][\w.@+-]*")
+
+_rate_lock: Any = None
+_rate_next_slot: Any = None
+_rate_interval = 0.0
+
+
+@dataclass
+class Account:
+    """WHOOP credentials for one member of the team."""
+
+    name: str
+    username: str
+    password: str
+
+    def __post_init__(self):
+        """Check that the name is safe to use as a partition directory.
+
+        Raises:
+            ValueError: If the name contains a path separator or starts with a dot.
+        """
+        if not _ACCOUNT_NAME.fullmatch(self.name):
+            raise ValueError(f"Invalid account name: {self.name!r}")
+
+
+@dataclass
+class AccountResult:
+    """Outcome of syncing one account."""
+
+    name: str
+    user_id: str = ""
+    records: int = 0
+    duration_seconds: float = 0.0
+    output_path: str = ""
+    error: str | None = None
+
+
+def load_roster(path: str) -> list[Account]:
+    """Load a team roster from a JSON file.
+
+    Each entry needs a `username` and either a `password` or a `password_env` naming
+    the environment variable holding the password. `name` defaults to the username
+    and is used for the account's output partition and token cache.
+
+    Args:
+        path (str): Path to the roster file.
+
+    Returns:
+        list[Account]: Accounts in roster order.
+
+    Raises:
+        ValueError: If an entry has no password, an invalid name, or two entries
+            share a name.
+    """
+    with open(path, encoding="utf-8") as file:
+        entries = json.load(file)
+
+    accounts = []
+    for entry in entries:
+        password = entry.get("password") or os.getenv(entry.get("password_env", ""))
+        if not password:
+            raise ValueError(f"No password configured for {entry['username']}")
+
+        accounts.append(
+            Account(
+                name=entry.get("name") or entry["username"],
+                username=entry["username"],
+                password=password,
+            )
+        )
+
+    names = [account.name for account in accounts]
+    if len(names) != len(set(names)):
+        raise ValueError("Roster account names must be unique")
+
+    return accounts
+
+
+class RateLimitedWhoopClient(WhoopClient):
+    """WHOOP client that waits for the team-wide request budget before each call."""
+
+    def _make_request(
+        self, method: str, url_slug: str, **kwargs: Any
+    ) -> dict[str, Any]:
+        _wait_for_rate_budget()
+        return super()._make_request(method, url_slug, **kwargs)
+
+
+def _init_worker(lock: Any, next_slot: Any, interval: float) -> None:
+    # pylint: disable-next=global-statement
+    global _rate_lock, _rate_next_slot, _rate_interval
+
+    _rate_lock = lock
+    _rate_next_slot = next_slot
+    _rate_interval = interval
+
+
+def _wait_for_rate_budget() -> None:
+    if _rate_lock is None or _rate_interval <= 0:
+        return
+
+    with _rate_lock:
+        now = time.monotonic()
+        slot = max(now, _rate_next_slot.value)
+        _rate_next_slot.value = slot + _rate_interval
+
+    if slot > now:
+        time.sleep(slot - now)
+
+
+def _connect(account: Account, token_dir: str) -> WhoopClient:
+    client = RateLimitedWhoopClient(
+        account.username, account.password, authenticate=False
+    )
+    # Keyed by the login rather than the roster name, so renaming or reassigning a
+    # roster entry can never reuse another account's token
+    digest = hashlib.sha256(account.username.lower().encode("utf-8")).hexdigest()
+    token_path = os.path.join(token_dir, f"{digest[:32]}.json")
+
+    if os.path.exists(token_path):
+        with open(token_path, encoding="utf-8") as file:
+            cached = json.load(file)
+
+        token = cached.get("token", {})
+        if cached.get("username") == account.username and token.get("expires_at"):
+            client.session.token = token
+            if not client.token_expires_soon():
+                client.user_id = str(token.get("user", {}).get("id", ""))
+                return client
+
+    client.authenticate()
+
+    fd = os.open(token_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as file:
+        json.dump(
+            {"username": account.username, "token": dict(client.session.token)}, file
+        )
+
+    return client
+
+
+def sync_account(
+    account: Account,
+    output_dir: str,
+    token_dir: str,
+    start_date: str,
+    end_date: str,
+) -> AccountResult:
+    """Fetch one account's sleep data and merge it into its own partition.
+
+    Args:
+        account (Account): Account to sync.
+        output_dir (str): Root of the output store.
+        token_dir (str): Directory holding cached OAuth tokens.
+        start_date (str): First date to fetch (YYYY-MM-DD).
+        end_date (str): Last date to fetch (YYYY-MM-DD).
+
+    Returns:
+        AccountResult: Record count, duration and any error for the account.
+    """
+    result = AccountResult(name=account.name)
+    started = time.perf_counter()
+
+    try:
+        with _connect(account, token_dir) as client:
+            result.user_id = client.user_id
+            sleep_data = client.get_sleep_collection(start_date, end_date)
+
+        partition = os.path.join(output_dir, f"user={account.name}")
+        os.makedirs(partition, exist_ok=True)
+        result.output_path = os.path.join(partition, "sleep.json")
+
+        update_collection(partition, "sleep", sleep_data)
+
+        result.records = len(sleep_data)
+    except Exception as e:  # noqa: B902 - one account must not fail the team
+        result.error = f"{type(e).__name__}: {e}"
+
+    result.duration_seconds = round(time.perf_counter() - started, 3)
+
+    return result
+
+
+def run_team_sync(
+    accounts: list[Account],
+    output_dir: str,
+    workers: int = 4,
+    requests_per_second: float = 5.0,
+    days: int = 3,
+) -> list[AccountResult]:
+    """Sync every account in the roster across a process pool.
+
+    Args:
+        accounts (list[Account]): Accounts to sync.
+        output_dir (str): Root of the output store. Each account is written to
+            `<output_dir>/user=<name>/`.
+        workers (int): Number of worker processes. Defaults to 4.
+        requests_per_second (float): Request budget shared by all workers. Zero or
+            less disables rate limiting. Defaults to 5.
+        days (int): How many days back to fetch. Defaults to 3.
+
+    Returns:
+        list[AccountResult]: One result per account, in completion order.
+    """
+    token_dir = os.path.join(output_dir, ".tokens")
+    os.makedirs(token_dir, exist_ok=True)
+
+    today = datetime.today().date()
+    start_date = (today - timedelta(days=days)).isoformat()
+    end_date = today.isoformat()
+
+    interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+    results = []
+
+    with ProcessPoolExecutor(
+        max_workers=max(1, min(workers, len(accounts))),
+        initializer=_init_worker,
+        initargs=(multiprocessing.Lock(), multiprocessing.Value("d", 0.0), interval),
+    ) as executor:
+        futures = [
+            executor.submit(
+                sync_account, account, output_dir, token_dir, start_date, end_date
+            )
+            for account in accounts
+        ]
+
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            status = result.error or f"{result.records} records"
+            print(f"{result.name}: {status} in {result.duration_seconds:.1f}s")
+
+    summary_path = os.path.join(output_dir, "summary.json")
+    with open(summary_path, "w", encoding="utf-8") as file:
+        json.dump([asdict(result) for result in results], file, indent=2)
+
+    failed = sum(1 for result in results if result.error)
+    print(f"Synced {len(results) - failed}/{len(results)} accounts, see {summary_path}")
+
+    return results
+
+
+def main() -> None:
+    """Run the team sync from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("roster", help="JSON file listing the team's accounts")
+    parser.add_argument("--output-dir", default="team_data")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests-per-second", type=float, default=5.0)
+    parser.add_argument("--days", type=int, default=3)
+    args = parser.parse_args()
+
+    run_team_sync(
+        load_roster(args.roster),
+        args.output_dir,
+        workers=args.workers,
+        requests_per_second=args.requests_per_second,
+        days=args.days,
+    )
+
+
+if __name__ == "__main__":
+    main()
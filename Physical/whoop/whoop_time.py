@@ -0,0 +1,144 @@
+"""Timezone normalization for WHOOP timestamps.
+
+The WHOOP API returns every timestamp in UTC together with the `timezone_offset` the
+strap was in when the record was created, e.g. "-05:00". These helpers turn those
+pairs into timezone-aware local datetimes.
+
+A user only ever has a handful of distinct offsets, so each offset string is parsed
+once and the resulting `tzinfo` is reused for every later timestamp.
+
+"""
+
+from __future__ import annotations
+
+import re
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Iterable
+
+
+_OFFSET_PATTERN = re.compile(r"^([+-])(\d{2}):?(\d{2})$")
+
+
+@lru_cache(maxsize=64)
+def parse_offset(offset_str: str) -> timezone:
+    """Parse a WHOOP `timezone_offset` into a fixed-offset `tzinfo`.
+
+    Args:
+        offset_str (str): Offset from UTC, e.g. "-05:00", "+0530" or "Z".
+
+    Returns:
+        timezone: Fixed-offset timezone for `offset_str`.
+
+    Raises:
+        ValueError: If `offset_str` is not a valid UTC offset.
+    """
+    if offset_str in ("Z", "z"):
+        return timezone.utc
+
+    match = _OFFSET_PATTERN.match(offset_str.strip())
+    if not match:
+        raise ValueError(f"Invalid timezone offset: {offset_str!r}")
+
+    sign, hours, minutes = match.groups()
+    delta = timedelta(hours=int(hours), minutes=int(minutes))
+
+    return timezone(-delta if sign == "-" else delta)
+
+
+def parse_utc(dt_str: str) -> datetime:
+    """Parse a UTC timestamp returned by the WHOOP API.
+
+    Args:
+        dt_str (str): Timestamp such as "2022-04-24T02:25:44.774Z".
+
+    Returns:
+        datetime: Timezone-aware datetime in UTC.
+    """
+    dt = datetime.fromisoformat(dt_str.replace("Z", "+00:00"))
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def to_local(dt_str: str, offset_str: str) -> datetime:
+    """Convert a WHOOP UTC timestamp to local time.
+
+    Args:
+        dt_str (str): UTC timestamp as returned by the WHOOP API.
+        offset_str (str): The record's `timezone_offset`.
+
+    Returns:
+        datetime: Timezone-aware datetime in the record's local time.
+    """
+    return parse_utc(dt_str).astimezone(parse_offset(offset_str))
+
+
+def to_local_column(
+    dt_strs: Iterable[str], offset_strs: Iterable[str]
+) -> list[datetime]:
+    """Convert a column of WHOOP UTC timestamps to local time in one pass.
+
+    Timestamps without an offset are read as UTC, as in `parse_utc`.
+
+    Args:
+        dt_strs (Iterable[str]): UTC timestamps as returned by the WHOOP API.
+        offset_strs (Iterable[str]): Matching `timezone_offset` values.
+
+    Returns:
+        list[datetime]: Timezone-aware local datetimes, in input order.
+    """
+    utc = parse_utc
+    tz_for = parse_offset
+
+    return [
+        utc(dt_str).astimezone(tz_for(offset_str))
+        for dt_str, offset_str in zip(dt_strs, offset_strs)
+    ]
+
+
+def localize_records(
+    records: Iterable[dict], field: str, offset_field: str = "timezone_offset"
+) -> list[datetime]:
+    """Convert one timestamp field of many WHOOP records to local time.
+
+    Args:
+        records (Iterable[dict]): Records from a WHOOP collection endpoint.
+        field (str): Name of the timestamp field, e.g. "start" or "end".
+        offset_field (str): Name of the offset field. Defaults to "timezone_offset".
+
+    Returns:
+        list[datetime]: Timezone-aware local datetimes, in record order.
+    """
+    records = list(records)
+    return to_local_column(
+        (record[field] for record in records),
+        (record[offset_field] for record in records),
+    )
+
+
+def _benchmark(n: int = 200_000) -> None:
+    """Time per-call against bulk conversion."""
+    import random
+    import timeit
+
+    rng = random.Random(0)
+    offsets = ["-05:00", "-04:00", "+00:00", "+05:30", "+09:45", "-09:30"]
+    base = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    stamps = [
+        (base + timedelta(seconds=rng.randrange(5 * 365 * 86400)))
+        .isoformat(timespec="milliseconds")
+        .replace("+00:00", "Z")
+        for _ in range(n)
+    ]
+    zones = [rng.choice(offsets) for _ in range(n)]
+
+    per_call = timeit.timeit(
+        lambda: [to_local(s, o) for s, o in zip(stamps, zones)], number=1
+    )
+    bulk = timeit.timeit(lambda: to_local_column(stamps, zones), number=1)
+
+    print(f"{n} timestamps: per-call {per_call:.3f}s, bulk {bulk:.3f}s")
+    print(f"bulk throughput: {n / bulk:,.0f} timestamps/s")
+
+
+if __name__ == "__main__":
+    _benchmark()
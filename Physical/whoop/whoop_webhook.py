@@ -0,0 +1,658 @@
+"""Webhook-driven incremental sync of WHOOP sleep, recovery and workout data.
+
+Instead of polling a fixed 3-day window, WHOOP can notify us whenever a record
+changes. This module provides:
+
+- `create_app`: a small Flask receiver that verifies WHOOP's signature (with the
+  client secret in `WHOOP_WEBHOOK_SECRET`), rejects stale timestamps and queues the
+  changed record IDs,
+- `EventQueue`: coalesces bursts of events so a record updated several times in a
+  row is fetched once,
+- `IncrementalSyncer`: fetches only the changed records by ID and pushes them to the
+  sinks, plus a periodic sparse reconciliation sweep that pushes only records whose
+  `updated_at` is newer than what was last synced and deletes synced records that
+  have disappeared from WHOOP, and
+- `LocalEventEmitter`: posts signed events to a receiver, for local testing.
+
+WHOOP webhook events look like `{"user_id": 10129, "id": 93845, "type":
+"sleep.updated", "trace_id": "..."}`. For recovery events `id` is the ID of the sleep
+the recovery belongs to.
+
+Usage:
+    python whoop_webhook.py serve --port 8080
+    python whoop_webhook.py emit sleep.updated 93845 \
+        --url http://localhost:8080/whoop/webhook
+
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import re
+import threading
+import time
+import urllib.request
+from datetime import date, timedelta
+from typing import TYPE_CHECKING, Any, Callable
+
+from whoop_profiling import span
+from whoop_sleep import WhoopClient, extract_sleep_data, get_client, get_table
+from whoop_time import parse_utc
+
+
+if TYPE_CHECKING:
+    from flask import Flask
+
+
+WEBHOOK_SECRET = os.getenv("WHOOP_WEBHOOK_SECRET") or ""
+SYNC_STATE_PATH = os.getenv("WHOOP_SYNC_STATE_PATH") or "whoop_sync_state.json"
+
+EVENT_COLLECTIONS = ("sleep", "recovery", "workout")
+MAX_SIGNATURE_AGE_SECONDS = 300
+
+# WHOOP record IDs are integers (v1) or UUIDs (v2)
+_RECORD_ID = re.compile(
+    r"\d{1,19}|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}", re.I
+)
+
+# Sinks receive (collection, updated records, deleted record IDs)
+Sink = Callable[[str, list[dict[str, Any]], list[str]], None]
+
+
+def sign(body: bytes, timestamp: str, secret: str) -> str:
+    """Compute the WHOOP webhook signature of a request body.
+
+    Args:
+        body (bytes): Raw request body.
+        timestamp (str): Value of the `X-WHOOP-Signature-Timestamp` header.
+        secret (str): The app's client secret.
+
+    Returns:
+        str: Base64-encoded HMAC-SHA256 of `timestamp + body`.
+    """
+    digest = hmac.new(
+        secret.encode("utf-8"), timestamp.encode("utf-8") + body, hashlib.sha256
+    ).digest()
+    return base64.b64encode(digest).decode("ascii")
+
+
+class EventQueue:
+    """Thread-safe queue that coalesces bursts of WHOOP events.
+
+    Events for the same record are merged, with a deletion overriding earlier
+    updates. A batch is released once no new event has arrived for
+    `coalesce_seconds`, or once the oldest pending event is `max_delay_seconds` old.
+    """
+
+    def __init__(self, coalesce_seconds: float = 5.0, max_delay_seconds: float = 60.0):
+        """Initialize an empty queue.
+
+        Args:
+            coalesce_seconds (float): Quiet period that ends a burst. Defaults to 5.
+            max_delay_seconds (float): Longest an event waits in the queue. Defaults
+                to 60.
+        """
+        self.coalesce_seconds = coalesce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self._pending: dict[tuple[str, str], str] = {}
+        self._first_at = 0.0
+        self._last_at = 0.0
+        self._condition = threading.Condition()
+
+    def put(self, event: dict[str, Any]) -> bool:
+        """Queue a WHOOP webhook event.
+
+        Args:
+            event (dict[str, Any]): Event payload with `type` and `id`.
+
+        Returns:
+            bool: Whether the event type is one this sync handles.
+
+        Raises:
+            ValueError: If the event's `id` is not a WHOOP record ID.
+        """
+        collection, _, action = str(event.get("type", "")).partition(".")
+        if collection not in EVENT_COLLECTIONS or action not in ("updated", "deleted"):
+            return False
+
+        record_id = str(event.get("id", ""))
+        if not _RECORD_ID.fullmatch(record_id):
+            raise ValueError(f"Invalid record ID: {record_id!r}")
+
+        with self._condition:
+            now = time.monotonic()
+            if not self._pending:
+                self._first_at = now
+            self._last_at = now
+
+            key = (collection, record_id)
+            if self._pending.get(key) != "deleted":
+                self._pending[key] = action
+            self._condition.notify()
+
+        return True
+
+    def get_batch(self, timeout: float | None = None) -> dict[tuple[str, str], str]:
+        """Wait for the next coalesced batch of events.
+
+        Args:
+            timeout (float, optional): Seconds to wait for a first event. Waits
+                indefinitely if `None`.
+
+        Returns:
+            dict[tuple[str, str], str]: "updated" or "deleted" per
+                (collection, record ID). Empty if `timeout` expired.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._pending, timeout):
+                return {}
+
+            while True:
+                now = time.monotonic()
+                release_at = min(
+                    self._last_at + self.coalesce_seconds,
+                    self._first_at + self.max_delay_seconds,
+                )
+                if now >= release_at:
+                    break
+                self._condition.wait(release_at - now)
+
+            batch, self._pending = self._pending, {}
+
+        return batch
+
+
+class IncrementalSyncer:
+    """Fetch changed WHOOP records by ID and push them to the sinks.
+
+    Attributes:
+        sinks (list[Sink]): Callables receiving (collection, records, deleted IDs).
+        state_path (str): JSON file holding the `updated_at` and `start` of every
+            synced record (for recoveries, the start of their cycle and their
+            `sleep_id`).
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], WhoopClient],
+        sinks: list[Sink],
+        state_path: str = SYNC_STATE_PATH,
+    ):
+        """Initialize a syncer.
+
+        Args:
+            client_factory (Callable[[], WhoopClient]): Returns an authenticated
+                client. Called for every batch and sweep, so a factory such as
+                `whoop_sleep.get_client` can refresh an expiring token.
+            sinks (list[Sink]): Callables receiving (collection, records, deleted
+                IDs).
+            state_path (str): JSON file holding the `updated_at` and `start` of every
+                synced record. Defaults to `WHOOP_SYNC_STATE_PATH` or
+                "whoop_sync_state.json".
+        """
+        self.sinks = sinks
+        self.state_path = state_path
+        self._client_factory = client_factory
+        # collection -> record ID -> [updated_at, start] (+ sleep_id for recoveries)
+        self._seen: dict[str, dict[str, Any]] = {}
+
+        if os.path.exists(state_path):
+            with open(state_path, encoding="utf-8") as file:
+                self._seen = json.load(file)
+
+    def process(self, batch: dict[tuple[str, str], str]) -> list[tuple[str, str]]:
+        """Fetch the updated records of a batch and push the batch to the sinks.
+
+        A record that fails to fetch (e.g. a sleep deleted right after its update
+        event) is skipped and left to the reconciliation sweep; the rest of the
+        batch, including its deletions, is still pushed. Recovery deletions carry
+        the sleep ID and are pushed under the cycle ID recoveries are keyed by.
+
+        Args:
+            batch (dict[tuple[str, str], str]): Batch from `EventQueue.get_batch()`.
+
+        Returns:
+            list[tuple[str, str]]: (collection, record ID) of updates that failed to
+                fetch.
+        """
+        client = self._client_factory()
+        updated: dict[str, list[dict[str, Any]]] = {}
+        deleted: dict[str, list[str]] = {}
+        failed = []
+
+        for (collection, record_id), action in batch.items():
+            if action == "deleted":
+                deleted.setdefault(collection, []).extend(
+                    self._recovery_ids(record_id)
+                    if collection == "recovery"
+                    else [record_id]
+                )
+                continue
+
+            try:
+                fetched = self._fetch(client, collection, record_id)
+            except Exception as e:  # noqa: B902 - the reconciliation sweep catches up
+                print(f"Error fetching {collection} {record_id}: {e}")
+                failed.append((collection, record_id))
+                continue
+
+            for fetched_collection, record in fetched:
+                updated.setdefault(fetched_collection, []).append(record)
+
+        self._push(updated, deleted)
+
+        return failed
+
+    def reconcile(self, days: int = 7) -> int:
+        """Sweep a recent window and push only the changes the events missed.
+
+        Records that are new or updated since they were last synced are pushed as
+        updates. Synced records that started inside the window but are no longer
+        returned by WHOOP are pushed as deletions. The first day of the window is
+        not checked for deletions, since the API filters on a UTC boundary.
+
+        Args:
+            days (int): How many days back to sweep. Defaults to 7.
+
+        Returns:
+            int: Number of records pushed to the sinks.
+        """
+        start = (date.today() - timedelta(days=days)).isoformat()
+        end = date.today().isoformat()
+        deletion_cutoff = (date.today() - timedelta(days=days - 1)).isoformat()
+
+        client = self._client_factory()
+        fetched = {
+            "sleep": client.get_sleep_collection(start, end),
+            "cycle": client.get_cycle_collection(start, end),
+            "recovery": client.get_recovery_collection(start, end),
+            "workout": client.get_workout_collection(start, end),
+        }
+        missed = {
+            collection: [
+                record for record in records if self._is_new(collection, record)
+            ]
+            for collection, records in fetched.items()
+        }
+        deleted = {}
+        for collection, records in fetched.items():
+            returned = {_record_id(record) for record in records}
+            deleted[collection] = [
+                record_id
+                for record_id, entry in self._seen.get(collection, {}).items()
+                if isinstance(entry, list)
+                and entry[1] >= deletion_cutoff
+                and record_id not in returned
+            ]
+        self._push(missed, deleted)
+
+        updated_count = sum(len(records) for records in missed.values())
+        deleted_count = sum(len(record_ids) for record_ids in deleted.values())
+        print(
+            f"Reconciliation pushed {updated_count} missed update(s) and "
+            f"{deleted_count} deletion(s)"
+        )
+
+        return updated_count + deleted_count
+
+    def _fetch(
+        self, client: WhoopClient, collection: str, record_id: str
+    ) -> list[tuple[str, dict[str, Any]]]:
+        if collection == "sleep":
+            return [("sleep", client.get_sleep_by_id(record_id))]
+
+        if collection == "workout":
+            return [("workout", client.get_workout_by_id(record_id))]
+
+        # Recovery events carry the sleep ID; the recovery is found via its sleep and
+        # its cycle is refreshed too, since strain is final once recovery is scored.
+        sleep = client.get_sleep_by_id(record_id)
+        day = parse_utc(sleep["end"]).date()
+        recoveries = [
+            recovery
+            for recovery in client.get_recovery_collection(
+                (day - timedelta(days=1)).isoformat(), day.isoformat()
+            )
+            if str(recovery.get("sleep_id")) == record_id
+        ]
+        cycles = [
+            client.get_cycle_by_id(recovery["cycle_id"])
+            for recovery in recoveries
+        ]
+
+        return [("recovery", recovery) for recovery in recoveries] + [
+            ("cycle", cycle) for cycle in cycles
+        ]
+
+    def _push(
+        self,
+        updated: dict[str, list[dict[str, Any]]],
+        deleted: dict[str, list[str]],
+    ) -> None:
+        # Cycles sort before recoveries, so sinks can resolve a recovery's cycle
+        for collection in sorted(set(updated) | set(deleted)):
+            records = updated.get(collection, [])
+            deleted_ids = deleted.get(collection, [])
+            if not records and not deleted_ids:
+                continue
+
+            for sink in self.sinks:
+                with span(f"sink:{getattr(sink, '__name__', type(sink).__name__)}"):
+                    sink(collection, records, deleted_ids)
+
+            seen = self._seen.setdefault(collection, {})
+            for record in records:
+                seen[_record_id(record)] = self._entry(collection, record)
+            for record_id in deleted_ids:
+                seen.pop(record_id, None)
+
+        self._save_state()
+
+    def _entry(self, collection: str, record: dict[str, Any]) -> list[str]:
+        if collection != "recovery":
+            return [record.get("updated_at", ""), record.get("start", "")]
+
+        # Recoveries have no `start`; their cycle's is used for the deletion sweep,
+        # and their `sleep_id` resolves deletion events, which carry the sleep ID.
+        cycle = self._seen.get("cycle", {}).get(str(record.get("cycle_id")))
+        start = cycle[1] if isinstance(cycle, list) else record.get("created_at", "")
+        return [record.get("updated_at", ""), start, str(record.get("sleep_id", ""))]
+
+    def _recovery_ids(self, sleep_id: str) -> list[str]:
+        return [
+            cycle_id
+            for cycle_id, entry in self._seen.get("recovery", {}).items()
+            if isinstance(entry, list) and entry[2:] == [sleep_id]
+        ]
+
+    def _is_new(self, collection: str, record: dict[str, Any]) -> bool:
+        seen = self._seen.get(collection, {}).get(_record_id(record))
+        if seen is None:
+            return True
+        # State files written before `start` was tracked hold only `updated_at`
+        updated_at = seen[0] if isinstance(seen, list) else seen
+        return record.get("updated_at", "") > updated_at
+
+    def _save_state(self) -> None:
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self._seen, file)
+        os.replace(tmp_path, self.state_path)
+
+
+def _record_id(record: dict[str, Any]) -> str:
+    return str(record.get("id", record.get("cycle_id")))
+
+
+def airtable_sleep_sink(
+    collection: str, records: list[dict[str, Any]], deleted_ids: list[str]
+) -> None:
+    """Upsert changed sleeps into Airtable and remove deleted ones.
+
+    Args:
+        collection (str): Collection of the records. Non-sleep batches are ignored.
+        records (list[dict[str, Any]]): Raw sleep records.
+        deleted_ids (list[str]): IDs of deleted sleeps.
+    """
+    if collection != "sleep":
+        return
+
+    from pyairtable.formulas import match
+
+    table = get_table()
+    rows = extract_sleep_data(records)
+    if rows:
+        table.batch_upsert([{"fields": row} for row in rows], key_fields=["ID"])
+        print(f"Upserted {len(rows)} sleep record(s)")
+
+    for record_id in deleted_ids:
+        for existing in table.all(formula=match({"ID": record_id})):
+            table.delete(existing["id"])
+            print(f"Deleted sleep record: {record_id}")
+
+
+_ROLLUP_ARGUMENTS = {"sleep": "sleeps", "cycle": "cycles", "recovery": "recoveries"}
+
+
+def rollup_sink(path: str) -> Sink:
+    """Build a sink that folds changes and deletions into the rollup index at `path`.
+
+    Args:
+        path (str): JSON file holding the rollup index.
+
+    Returns:
+        Sink: The sink.
+    """
+    from whoop_rollups import update_rollups
+
+    # Sinks are named after what they write to; profiling spans use the name
+    def rollups(
+        collection: str, records: list[dict[str, Any]], deleted_ids: list[str]
+    ) -> None:
+        if argument := _ROLLUP_ARGUMENTS.get(collection):
+            if records or deleted_ids:
+                update_rollups(
+                    path, **{argument: records}, deleted={collection: deleted_ids}
+                )
+
+    return rollups
+
+
+def local_store_sink(data_dir: str) -> Sink:
+    """Build a sink that merges changes into the collection files in `data_dir`.
+
+    These are the files written by `whoop_backfill.py` and served by
+    `whoop_read_service.py`.
+
+    Args:
+        data_dir (str): Directory of the collection files.
+
+    Returns:
+        Sink: The sink.
+    """
+    from whoop_backfill import update_collection
+
+    def local_store(
+        collection: str, records: list[dict[str, Any]], deleted_ids: list[str]
+    ) -> None:
+        update_collection(data_dir, collection, records, deleted_ids)
+
+    return local_store
+
+
+def create_app(queue: EventQueue, secret: str = WEBHOOK_SECRET) -> Flask:
+    """Create the Flask app receiving WHOOP webhooks.
+
+    Args:
+        queue (EventQueue): Queue the received events are put on.
+        secret (str): Client secret used to verify signatures. Defaults to
+            `WHOOP_WEBHOOK_SECRET`.
+
+    Returns:
+        Flask: App with a POST `/whoop/webhook` route.
+
+    Raises:
+        ValueError: If `secret` is empty.
+    """
+    if not secret:
+        raise ValueError("A webhook secret is required to verify WHOOP events")
+
+    from flask import Flask, request
+
+    app = Flask(__name__)
+
+    @app.route("/whoop/webhook", methods=["POST"])
+    def whoop_webhook():
+        body = request.get_data()
+        timestamp = request.headers.get("X-WHOOP-Signature-Timestamp", "")
+        expected = sign(body, timestamp, secret)
+        if not hmac.compare_digest(
+            expected, request.headers.get("X-WHOOP-Signature", "")
+        ):
+            return {"error": "Invalid signature"}, 401
+
+        # Signed events are replayable, so only recent timestamps are accepted
+        if not timestamp.isdigit() or (
+            abs(time.time() - int(timestamp) / 1000) > MAX_SIGNATURE_AGE_SECONDS
+        ):
+            return {"error": "Stale signature timestamp"}, 401
+
+        try:
+            event = json.loads(body)
+            handled = queue.put(event)
+        except (ValueError, AttributeError) as e:
+            return {"error": f"Invalid event: {e}"}, 400
+
+        if not handled:
+            app.logger.info(f"Ignoring WHOOP event: {event.get('type')}")
+
+        return "", 204
+
+    return app
+
+
+def run_worker(
+    queue: EventQueue,
+    syncer: IncrementalSyncer,
+    stop: threading.Event,
+    reconcile_every_seconds: float = 6 * 60 * 60,
+) -> None:
+    """Process coalesced batches until `stop` is set, reconciling periodically.
+
+    Args:
+        queue (EventQueue): Queue of received events.
+        syncer (IncrementalSyncer): Syncer that fetches and pushes records.
+        stop (threading.Event): Set to stop the worker.
+        reconcile_every_seconds (float): Interval between reconciliation sweeps.
+            Defaults to 6 hours.
+    """
+    next_reconcile = time.monotonic()
+
+    while not stop.is_set():
+        if time.monotonic() >= next_reconcile:
+            try:
+                syncer.reconcile()
+            except Exception as e:  # noqa: B902 - retried on the next sweep
+                print(f"Reconciliation failed: {e}")
+            next_reconcile = time.monotonic() + reconcile_every_seconds
+
+        batch = queue.get_batch(timeout=1.0)
+        if not batch:
+            continue
+
+        try:
+            failed = syncer.process(batch)
+            print(f"Synced {len(batch) - len(failed)} changed record(s)")
+        except Exception as e:  # noqa: B902 - the reconciliation sweep catches up
+            print(f"Error syncing batch {sorted(batch)}: {e}")
+
+
+class LocalEventEmitter:
+    """Post signed WHOOP-style webhook events to a receiver, for local testing."""
+
+    def __init__(self, url: str, secret: str = WEBHOOK_SECRET, user_id: int = 0):
+        """Initialize an emitter.
+
+        Args:
+            url (str): URL of the webhook receiver.
+            secret (str): Client secret used to sign events. Defaults to
+                `WHOOP_WEBHOOK_SECRET`.
+            user_id (int): `user_id` put on every event. Defaults to 0.
+        """
+        self.url = url
+        self.secret = secret
+        self.user_id = user_id
+
+    def emit(self, event_type: str, record_id: Any) -> int:
+        """Post one event.
+
+        Args:
+            event_type (str): Event type, e.g. "sleep.updated".
+            record_id (Any): ID of the changed record.
+
+        Returns:
+            int: HTTP status code of the response.
+        """
+        body = json.dumps(
+            {
+                "user_id": self.user_id,
+                "id": record_id,
+                "type": event_type,
+                "trace_id": f"local-{time.time_ns()}",
+            }
+        ).encode("utf-8")
+        timestamp = str(int(time.time() * 1000))
+        request = urllib.request.Request(
+            self.url,
+            data=body,
+            headers={
+                "Content-Type": "application/json",
+                "X-WHOOP-Signature-Timestamp": timestamp,
+                "X-WHOOP-Signature": sign(body, timestamp, self.secret),
+            },
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=10) as response:  # noqa: S310
+            return response.status
+
+
+def main() -> None:
+    """Serve the webhook receiver or emit a test event from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="run the receiver and sync worker")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8080)
+    serve.add_argument("--coalesce-seconds", type=float, default=5.0)
+    serve.add_argument("--reconcile-hours", type=float, default=6.0)
+
+    emit = commands.add_parser("emit", help="post a signed test event")
+    emit.add_argument("type", help="event type, e.g. sleep.updated")
+    emit.add_argument("id", help="ID of the changed record")
+    emit.add_argument("--url", default="http://127.0.0.1:8080/whoop/webhook")
+
+    args = parser.parse_args()
+
+    if args.command == "emit":
+        status = LocalEventEmitter(args.url).emit(args.type, args.id)
+        print(f"Receiver responded with {status}")
+        return
+
+    if not WEBHOOK_SECRET:
+        parser.error("WHOOP_WEBHOOK_SECRET must be set to verify incoming events")
+
+    queue = EventQueue(coalesce_seconds=args.coalesce_seconds)
+    sinks: list[Sink] = [airtable_sleep_sink]
+    if data_dir := os.getenv("WHOOP_DATA_DIR"):
+        sinks.append(local_store_sink(data_dir))
+    if rollup_path := os.getenv("ROLLUP_INDEX_PATH"):
+        sinks.append(rollup_sink(rollup_path))
+    if anomaly_path := os.getenv("ANOMALY_STATE_PATH"):
+        from whoop_anomaly import AnomalyDetector, print_anomalies
+
+        sinks.append(AnomalyDetector(anomaly_path).as_sink([print_anomalies]))
+
+    stop = threading.Event()
+    worker = threading.Thread(
+        target=run_worker,
+        args=(queue, IncrementalSyncer(get_client, sinks), stop),
+        kwargs={"reconcile_every_seconds": args.reconcile_hours * 60 * 60},
+        daemon=True,
+    )
+    worker.start()
+
+    try:
+        create_app(queue).run(host=args.host, port=args.port)
+    finally:
+        stop.set()
+        worker.join()
+
+
+if __name__ == "__main__":
+    main()
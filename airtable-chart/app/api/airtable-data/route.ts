@@ -9,17 +9,62 @@ interface AirtableRecord {
   };
 }
 
-export async function GET() {
+interface ChartRow {
+  date: string;
+  activity: string;
+  elapsedTime: number;
+}
+
+// Columnar snapshot published by Physical/whoop/whoop_snapshot.py after each sync
+interface ChartSnapshot {
+  version: number;
+  generated_at: string;
+  count: number;
+  date: string[];
+  activity: string[];
+  elapsedTime: number[];
+}
+
+const REVALIDATE_SECONDS = 300;
+const CACHE_HEADERS = {
+  'Cache-Control': `public, s-maxage=${REVALIDATE_SECONDS}, stale-while-revalidate=3600`,
+};
+
+async function fetchSnapshot(snapshotUrl: string): Promise<ChartRow[]> {
+  const response = await fetch(snapshotUrl, { next: { revalidate: REVALIDATE_SECONDS } });
+
+  if (!response.ok) {
+    throw new Error(`Error fetching snapshot: ${response.statusText}`);
+  }
+
+  const snapshot: ChartSnapshot = await response.json();
+
+  return snapshot.date.map((date, i) => ({
+    date,
+    activity: snapshot.activity[i],
+    elapsedTime: snapshot.elapsedTime[i],
+  }));
+}
+
+async function fetchAirtable(): Promise<ChartRow[]> {
   const baseId = process.env.AIRTABLE_BASE_ID;
   const tableName = process.env.AIRTABLE_TABLE_NAME;
-  const url = `https://api.airtable.com/v0/${baseId}/${tableName}`;
   const apiKey = process.env.AIRTABLE_API_KEY;
+  const records: AirtableRecord[] = [];
+  let offset: string | undefined;
+
+  // Airtable returns at most 100 records per page, so follow `offset` to the end
+  do {
+    const url = new URL(`https://api.airtable.com/v0/${baseId}/${tableName}`);
+    if (offset) {
+      url.searchParams.set('offset', offset);
+    }
 
-  try {
     const response = await fetch(url, {
       headers: {
         Authorization: `Bearer ${apiKey}`,
       },
+      next: { revalidate: REVALIDATE_SECONDS },
     });
 
     if (!response.ok) {
@@ -27,16 +72,26 @@ export async function GET() {
       throw new Error(`Error: ${response.statusText}, Details: ${errorText}`);
     }
 
-    const data: { records: AirtableRecord[] } = await response.json();
+    const data: { records: AirtableRecord[]; offset?: string } = await response.json();
+    records.push(...data.records);
+    offset = data.offset;
+  } while (offset);
 
-    // Ensure proper extraction and formatting
-    const formattedData = data.records.map((record) => ({
-      date: record.fields.Date || 'No Date',        
-      activity: record.fields.Activity || 'No Activity',
-      elapsedTime: record.fields['Elapsed Time'] || 0,
-    }));
+  // Ensure proper extraction and formatting
+  return records.map((record) => ({
+    date: record.fields.Date || 'No Date',
+    activity: record.fields.Activity || 'No Activity',
+    elapsedTime: record.fields['Elapsed Time'] || 0,
+  }));
+}
+
+export async function GET() {
+  const snapshotUrl = process.env.CHART_SNAPSHOT_URL;
+
+  try {
+    const formattedData = snapshotUrl ? await fetchSnapshot(snapshotUrl) : await fetchAirtable();
 
-    return NextResponse.json(formattedData);
+    return NextResponse.json(formattedData, { headers: CACHE_HEADERS });
   } catch (error) {
     console.error(error);
     return NextResponse.json({ error: 'Failed to fetch data from Airtable' }, { status: 500 });